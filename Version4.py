@@ -1,9 +1,722 @@
 import sqlite3
-from collections import deque
+import os
+import sys
 import time
 import re
+import csv
+import threading
+import json
+import argparse
+from itertools import islice
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+import hashlib
+import hmac
+import secrets
+
+import analytics
+from money import format_cents, parse_cents, to_cents, total
+from instrumentation import export_metrics, profile_session, timed
+
+DB_PATH = 'shop_system.db'
+ORDER_FLUSH_SIZE = 50
+ORDER_FLUSH_INTERVAL = 5.0
+INVENTORY_FLUSH_SIZE = 50
+INVENTORY_FLUSH_INTERVAL = 5.0
+FLUSH_CHECK_INTERVAL = 1.0
+METRICS_EXPORT_INTERVAL = 15.0
+DB_JOURNAL_MODE = 'WAL'
+DB_SYNCHRONOUS = 'NORMAL'
+DB_POOL_SIZE = int(os.environ.get('SHOP_DB_POOL_SIZE', 4))
+DB_STATEMENT_CACHE = 256
+STOCK_IMPORT_CHUNK_SIZE = 1000
+INVENTORY_CACHE_SIZE = 64
+DELIVERY_TIME = 3
+DELIVERY_WORKERS = 8
+PAGE_SIZE = 20
+PASSWORD_ITERATIONS = int(os.environ.get('SHOP_PASSWORD_ITERATIONS', 100000))
+PASSWORD_CACHE_SIZE = 1024
+LOGIN_MAX_FAILURES = 5
+LOGIN_LOCKOUT_WINDOW = 300
+ACCOUNT_IMPORT_CHUNK_SIZE = 1000
+ACCOUNT_HASH_WORKERS = os.cpu_count() or 1
+
+PASSWORD_PATTERN = re.compile(r'(?=.*[A-Za-z])(?=.*\d)[A-Za-z\d]{8,16}')
+
+class ProductRecord:
+    __slots__ = ('quantity', 'price')
+
+    def __init__(self, quantity, price):
+        self.quantity = quantity
+        self.price = price
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        setattr(self, field, value)
+
+class OrderRecord:
+    __slots__ = ('id', 'name', 'shop', 'address', 'product', 'description', 'quantity', 'price', 'total')
+    FIELDS = {
+        'ID': 'id',
+        'Name': 'name',
+        'Shop': 'shop',
+        'Address': 'address',
+        'Product': 'product',
+        'Description': 'description',
+        'Quantity': 'quantity',
+        'Price': 'price',
+        'Total': 'total'
+    }
+
+    def __init__(self, name, shop, address, product, description, quantity, price, total, order_id=None):
+        self.id = order_id
+        self.name = sys.intern(name)
+        self.shop = sys.intern(shop)
+        self.address = address
+        self.product = sys.intern(product)
+        self.description = sys.intern(description)
+        self.quantity = quantity
+        self.price = price
+        self.total = total
+
+    def __getitem__(self, field):
+        return getattr(self, self.FIELDS[field])
+
+    def __setitem__(self, field, value):
+        setattr(self, self.FIELDS[field], value)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class OrderQueue:
+    def __init__(self):
+        self.orders = {}
+        self.by_user = {}
+        self.by_shop = {}
+        self.next_id = 1
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.orders.values()))
+
+    def append(self, order):
+        with self.lock:
+            if order['ID'] is None:
+                order['ID'] = self.next_id
+            self.next_id = max(self.next_id, order['ID'] + 1)
+            order_id = order['ID']
+            self.orders[order_id] = order
+            self.by_user.setdefault(order['Name'], {})[order_id] = order
+            self.by_shop.setdefault(order['Shop'], {})[order_id] = order
+            return order_id
+
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def remove(self, order_id):
+        with self.lock:
+            order = self.orders.pop(order_id)
+            self._unindex(self.by_user, order['Name'], order_id)
+            self._unindex(self.by_shop, order['Shop'], order_id)
+            return order
+
+    def take(self, order_id, username):
+        with self.lock:
+            order = self.orders.get(order_id)
+            if order is None or order['Name'] != username:
+                return None
+            return self.remove(order_id)
+
+    def _unindex(self, index, name, order_id):
+        orders = index[name]
+        del orders[order_id]
+        if not orders:
+            del index[name]
+
+    def user_orders(self, username):
+        with self.lock:
+            return list(self.by_user.get(username, {}).values())
+
+    def shop_orders(self, shop_name):
+        with self.lock:
+            return list(self.by_shop.get(shop_name, {}).values())
+
+    def has_shop_orders(self, shop_name):
+        return shop_name in self.by_shop
+
+    def pop_user(self, username):
+        with self.lock:
+            orders = self.by_user.get(username)
+            if not orders:
+                return None
+            return self.remove(next(iter(orders)))
+
+order_queue = OrderQueue()
+
+SAVE_ORDER_SQL = '''
+    INSERT OR REPLACE INTO orders (id, username, shop_name, address, product, description, quantity, price, total)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+DELETE_ORDER_SQL = 'DELETE FROM orders WHERE id = ?'
+
+SAVE_SALE_SQL = '''
+    INSERT INTO sales (order_id, username, shop_name, product, description, quantity, price, total, day, delivered_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+ROLLUP_DAILY_SALES_SQL = '''
+    INSERT INTO daily_sales (day, shop_name, orders, quantity, revenue)
+    VALUES (?, ?, 1, ?, ?)
+    ON CONFLICT (day, shop_name) DO UPDATE SET
+        orders = orders + 1,
+        quantity = quantity + excluded.quantity,
+        revenue = revenue + excluded.revenue
+'''
+
+ROLLUP_PRODUCT_SALES_SQL = '''
+    INSERT INTO product_sales (shop_name, product, description, orders, quantity, revenue)
+    VALUES (?, ?, ?, 1, ?, ?)
+    ON CONFLICT (shop_name, product, description) DO UPDATE SET
+        orders = orders + 1,
+        quantity = quantity + excluded.quantity,
+        revenue = revenue + excluded.revenue
+'''
+
+def sale_rows(sales):
+    # Rows for SAVE_SALE_SQL and the two rollups, from (order, delivered_at) pairs.
+    rows = ([], [], [])
+    for order, delivered_at in sales:
+        day = delivered_at[:10]
+        rows[0].append((order['ID'], order['Name'], order['Shop'], order['Product'], order['Description'],
+                        order['Quantity'], order['Price'], order['Total'], day, delivered_at))
+        rows[1].append((day, order['Shop'], order['Quantity'], order['Total']))
+        rows[2].append((order['Shop'], order['Product'], order['Description'], order['Quantity'], order['Total']))
+    return rows
+
+class OrderJournal:
+    def __init__(self, flush_size=ORDER_FLUSH_SIZE, flush_interval=ORDER_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.inserts = {}
+        self.deletes = set()
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.inserts) + len(self.deletes)
+
+    def record_inserts(self, orders):
+        # All of them land in the same flush.
+        with self.lock:
+            for order in orders:
+                self.inserts[order['ID']] = order
+        self.maybe_flush()
+
+    def record_delete(self, order_id):
+        with self.lock:
+            # An order placed and removed within the same batch never reaches the database.
+            if self.inserts.pop(order_id, None) is None:
+                self.deletes.add(order_id)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if len(self) >= self.flush_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not len(self):
+                return
+            # Stock added a moment ago must reach the table before the orders that reserved it.
+            if not inventory_sync.flush_keys({(order['Shop'], (order['Product'], order['Description']))
+                                              for order in self.inserts.values()}):
+                return
+            with UnitOfWork() as work:
+                for order in self.inserts.values():
+                    work.add(SAVE_ORDER_SQL, (order['ID'], order['Name'], order['Shop'], order['Address'], order['Product'],
+                                              order['Description'], order['Quantity'], order['Price'], order['Total']))
+                for order_id in self.deletes:
+                    work.add(DELETE_ORDER_SQL, (order_id,))
+            if work.committed is False:
+                return
+            self.inserts.clear()
+            self.deletes.clear()
+
+order_journal = OrderJournal()
+
+class InventorySync:
+    def __init__(self, flush_size=INVENTORY_FLUSH_SIZE, flush_interval=INVENTORY_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # shop name -> product key -> [stock added since the last flush, price]
+        self.dirty = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(products) for products in self.dirty.values())
+
+    def record(self, shop_name, product_key, quantity, price, auto_flush=True):
+        with self.lock:
+            change = self.dirty.setdefault(shop_name, {}).setdefault(product_key, [0, price])
+            change[0] += quantity
+        if auto_flush:
+            self.maybe_flush()
+
+    def pending(self, shop_name, product_key):
+        with self.lock:
+            change = self.dirty.get(shop_name, {}).get(product_key)
+            return change[0] if change else 0
+
+    def has_shop_changes(self, shop_name):
+        return bool(self.dirty.get(shop_name))
+
+    def maybe_flush(self):
+        if len(self) >= self.flush_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            self.write(self.dirty)
+
+    def flush_keys(self, lines):
+        # Called before orders or conditional stock updates that rely on stock added a moment ago being in the table.
+        with self.lock:
+            changes = {}
+            for shop_name, product_key in lines:
+                change = self.dirty.get(shop_name, {}).get(product_key)
+                if change is not None:
+                    changes.setdefault(shop_name, {})[product_key] = change
+            return self.write(changes)
+
+    @timed()
+    def write(self, changes):
+        if not any(changes.values()):
+            return True
+        with UnitOfWork() as work:
+            for shop_name, products in changes.items():
+                for (product, description), (quantity, price) in products.items():
+                    work.add(ADD_INVENTORY_SQL, (shop_name, product, description, quantity, price))
+        if work.committed is False:
+            return False
+        for shop_name, products in list(changes.items()):
+            for product_key in list(products):
+                self.dirty[shop_name].pop(product_key, None)
+            if not self.dirty[shop_name]:
+                del self.dirty[shop_name]
+        return True
+
+inventory_sync = InventorySync()
+
+class BackgroundFlusher:
+    # Writes only check the flush interval when they happen, so this thread flushes whatever a quiet spell leaves behind.
+    # It also refreshes the metrics snapshot, so a long-running server doesn't only write one on shutdown.
+    def __init__(self, check_interval=FLUSH_CHECK_INTERVAL, export_interval=METRICS_EXPORT_INTERVAL):
+        self.check_interval = check_interval
+        self.export_interval = export_interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='flusher', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        last_export = time.monotonic()
+        while not self.stopped.wait(self.check_interval):
+            inventory_sync.maybe_flush()
+            order_journal.maybe_flush()
+            if time.monotonic() - last_export >= self.export_interval:
+                last_export = time.monotonic()
+                write_metrics()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+background_flusher = BackgroundFlusher()
+
+SORT_FIELDS = {
+    'name': lambda item: (item[0][0].casefold(), item[0][1].casefold()),
+    'price': lambda item: item[1]['price'],
+    'quantity': lambda item: item[1]['quantity']
+}
+
+class ShopInventory(dict):
+    def __init__(self, items=()):
+        super().__init__()
+        self.names = {}
+        self.folded_names = {}
+        self.sorted_names = None
+        self.orderings = {}
+        self.version = 0
+        self.stock_version = 0
+        for product_key, details in dict(items).items():
+            self[product_key] = details
+
+    def __setitem__(self, product_key, details):
+        if product_key not in self:
+            product, description = product_key
+            product_key = (sys.intern(product), sys.intern(description))
+            if product not in self.names:
+                self.names[product] = []
+                self.folded_names.setdefault(product.casefold(), []).append(product)
+                self.sorted_names = None
+            self.names[product].append(description)
+            self.version += 1
+        super().__setitem__(product_key, details)
+
+    def __delitem__(self, product_key):
+        super().__delitem__(product_key)
+        self.unindex(product_key)
+
+    def pop(self, product_key, *default):
+        if product_key not in self:
+            return super().pop(product_key, *default)
+        details = super().pop(product_key)
+        self.unindex(product_key)
+        return details
+
+    def unindex(self, product_key):
+        product, description = product_key
+        self.version += 1
+        descriptions = self.names[product]
+        descriptions.remove(description)
+        if not descriptions:
+            del self.names[product]
+            folded = product.casefold()
+            self.folded_names[folded].remove(product)
+            if not self.folded_names[folded]:
+                del self.folded_names[folded]
+            self.sorted_names = None
+
+    def touch(self):
+        self.stock_version += 1
+
+    def sorted_keys(self, sort_by):
+        # Name and price orderings only change when products come and go, quantity also on every reservation.
+        version = (self.version, self.stock_version) if sort_by == 'quantity' else self.version
+        cached = self.orderings.get(sort_by)
+        if cached is None or cached[0] != version:
+            cached = (version, [product_key for product_key, _ in sorted(list(self.items()), key=SORT_FIELDS[sort_by])])
+            self.orderings[sort_by] = cached
+        return cached[1]
+
+    def iter_sorted(self, sort_by=None, descending=False):
+        if sort_by is None:
+            items = list(self.items())
+            yield from reversed(items) if descending else items
+            return
+        keys = self.sorted_keys(sort_by)
+        for product_key in reversed(keys) if descending else keys:
+            details = self.get(product_key)
+            if details is not None:
+                yield product_key, details
+
+    def find(self, product):
+        return [(product, description) for description in self.names.get(product, ())]
+
+    def find_casefold(self, product):
+        return [(name, description)
+                for name in self.folded_names.get(product.casefold(), ())
+                for description in self.names[name]]
+
+    def search_prefix(self, prefix, limit=10):
+        if self.sorted_names is None:
+            self.sorted_names = sorted(self.folded_names)
+        prefix = prefix.casefold()
+        matches = []
+        index = bisect_left(self.sorted_names, prefix)
+        while index < len(self.sorted_names) and len(matches) < limit:
+            folded = self.sorted_names[index]
+            if not folded.startswith(prefix):
+                break
+            matches.extend(self.folded_names[folded])
+            index += 1
+        return matches[:limit]
+
+LOAD_SHOP_SQL = 'SELECT product, description, quantity, price FROM inventories WHERE shop_name = ?'
+
+class LazyInventories(MutableMapping):
+    def __init__(self, max_shops=INVENTORY_CACHE_SIZE):
+        self.max_shops = max_shops
+        self.shops = {}
+        self.resident = OrderedDict()
+        # shop name -> number of callers holding it resident
+        self.pins = {}
+        self.lock = threading.RLock()
+
+    def register(self, shop_name):
+        self.shops.setdefault(shop_name, None)
+
+    def __contains__(self, shop_name):
+        return shop_name in self.shops
+
+    def __iter__(self):
+        return iter(list(self.shops))
+
+    def __len__(self):
+        return len(self.shops)
+
+    def __getitem__(self, shop_name):
+        with self.lock:
+            if shop_name in self.resident:
+                self.resident.move_to_end(shop_name)
+                return self.resident[shop_name]
+            if shop_name not in self.shops:
+                raise KeyError(shop_name)
+            inventory = self.load_shop(shop_name)
+            self.resident[shop_name] = inventory
+            self.evict(shop_name)
+            return inventory
+
+    def __setitem__(self, shop_name, inventory):
+        if not isinstance(inventory, ShopInventory):
+            inventory = ShopInventory(inventory)
+        with self.lock:
+            self.register(shop_name)
+            self.resident[shop_name] = inventory
+            self.resident.move_to_end(shop_name)
+            self.evict(shop_name)
+
+    def __delitem__(self, shop_name):
+        with self.lock:
+            del self.shops[shop_name]
+            self.resident.pop(shop_name, None)
+
+    def setdefault(self, shop_name, inventory=None):
+        with self.lock:
+            if shop_name not in self.shops:
+                self[shop_name] = inventory if inventory is not None else {}
+            return self[shop_name]
+
+    @contextmanager
+    def pinned(self, shop_name):
+        # Keeps the shop resident while the caller updates it over several steps.
+        with self.lock:
+            self.pins[shop_name] = self.pins.get(shop_name, 0) + 1
+            inventory = self.setdefault(shop_name)
+        try:
+            yield inventory
+        finally:
+            with self.lock:
+                self.pins[shop_name] -= 1
+                if not self.pins[shop_name]:
+                    del self.pins[shop_name]
+
+    @timed()
+    def load_shop(self, shop_name):
+        inventory = ShopInventory()
+        with pool.reader() as reader:
+            for product, description, quantity, price in reader.execute(LOAD_SHOP_SQL, (shop_name,)):
+                inventory[(product, description)] = ProductRecord(quantity, price)
+        # Pending orders still hold their stock, the table only changes on delivery.
+        for order in order_queue.shop_orders(shop_name):
+            product_key = (order['Product'], order['Description'])
+            if product_key in inventory:
+                inventory[product_key]['quantity'] -= order['Quantity']
+        return inventory
+
+    def evict(self, keep):
+        # Shops with pending orders or unsaved stock hold state that only exists in memory, so they stay resident.
+        while len(self.resident) > self.max_shops:
+            for shop_name in self.resident:
+                if (shop_name != keep and shop_name not in self.pins and not order_queue.has_shop_orders(shop_name)
+                        and not inventory_sync.has_shop_changes(shop_name)):
+                    del self.resident[shop_name]
+                    break
+            else:
+                return
+
+class StockLocks:
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def get(self, shop_name, product_key):
+        with self.lock:
+            return self.locks.setdefault((shop_name, product_key), threading.Lock())
+
+    @contextmanager
+    def hold(self, shop_name, product_key):
+        lock = self.get(shop_name, product_key)
+        waited = 0.0
+        if not lock.acquire(blocking=False):
+            start = time.perf_counter()
+            lock.acquire()
+            waited = time.perf_counter() - start
+        with self.lock:
+            self.acquisitions += 1
+            if waited:
+                self.contended += 1
+                self.wait_time += waited
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'locks': len(self.locks),
+                'acquisitions': self.acquisitions,
+                'contended': self.contended,
+                'contention_rate': self.contended / self.acquisitions if self.acquisitions else 0.0,
+                'wait_time': self.wait_time
+            }
+
+stock_locks = StockLocks()
+
+class DeliveryScheduler:
+    def __init__(self, workers=DELIVERY_WORKERS, delivery_time=DELIVERY_TIME):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delivery')
+        self.delivery_time = delivery_time
+        self.lock = threading.Lock()
+        self.arrived = {}
+
+    def schedule(self, order):
+        return self.executor.submit(self.deliver, order)
+
+    def deliver(self, order):
+        time.sleep(self.delivery_time)
+        with self.lock:
+            self.arrived.setdefault(order['Name'], {})[order['ID']] = order
+        return order
+
+    def arrived_orders(self, username):
+        with self.lock:
+            return list(self.arrived.get(username, {}).values())
+
+    def get(self, username, order_id):
+        with self.lock:
+            return self.arrived.get(username, {}).get(order_id)
+
+    def settle(self, username, order_id):
+        with self.lock:
+            orders = self.arrived.get(username, {})
+            order = orders.pop(order_id, None)
+            if not orders:
+                self.arrived.pop(username, None)
+            return order
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+delivery_scheduler = DeliveryScheduler()
+
+class Cart:
+    def __init__(self):
+        # (shop name, product, description) -> quantity
+        self.lines = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, shop_name, product, description, quantity):
+        if quantity <= 0:
+            raise InvalidProductError("Invalid quantity.")
+        with self.lock:
+            line = (shop_name, product, description)
+            self.lines[line] = self.lines.get(line, 0) + quantity
+
+    def remove(self, shop_name, product, description):
+        with self.lock:
+            return self.lines.pop((shop_name, product, description), None)
+
+    def items(self):
+        # Sorted, so every checkout takes the stock locks in the same order.
+        with self.lock:
+            return sorted(self.lines.items())
+
+    def clear(self):
+        with self.lock:
+            self.lines.clear()
+
+    def to_list(self):
+        return [{'shop': shop_name, 'product': product, 'description': description, 'quantity': quantity}
+                for (shop_name, product, description), quantity in self.items()]
+
+class VerificationCache:
+    def __init__(self, max_entries=PASSWORD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Entries are keyed by a keyed digest so the cache never holds anything that works as a password hash offline.
+        self.key = secrets.token_bytes(32)
+
+    def digest(self, stored, password):
+        return hmac.new(self.key, f"{stored}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def __contains__(self, digest):
+        with self.lock:
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                return True
+            return False
+
+    def add(self, digest):
+        with self.lock:
+            self.entries[digest] = None
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+verification_cache = VerificationCache()
+
+class LoginThrottle:
+    def __init__(self, max_failures=LOGIN_MAX_FAILURES, window=LOGIN_LOCKOUT_WINDOW):
+        self.max_failures = max_failures
+        self.window = window
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def recent_failures(self, username):
+        cutoff = time.monotonic() - self.window
+        failures = [moment for moment in self.failures.get(username, []) if moment > cutoff]
+        if failures:
+            self.failures[username] = failures
+        else:
+            self.failures.pop(username, None)
+        return failures
+
+    def check(self, username):
+        with self.lock:
+            if len(self.recent_failures(username)) >= self.max_failures:
+                raise LoginThrottledError("Too many failed attempts. Try again later.")
+
+    def record_failure(self, username):
+        with self.lock:
+            self.failures.setdefault(username, []).append(time.monotonic())
+
+    def reset(self, username):
+        with self.lock:
+            self.failures.pop(username, None)
 
-order_queue = deque()
+login_throttle = LoginThrottle()
 
 class InvalidPasswordError(Exception):
     pass
@@ -14,24 +727,340 @@ class InvalidShopNameError(Exception):
 class InsufficientFundsError(Exception):
     pass
 
+class InvalidUsernameError(Exception):
+    pass
+
+class InvalidRoleError(Exception):
+    pass
+
+class PermissionDeniedError(Exception):
+    pass
+
+class LoginError(Exception):
+    pass
+
+class LoginThrottledError(LoginError):
+    pass
+
+class InvalidProductError(ValueError):
+    pass
+
+class ProductNotFoundError(Exception):
+    pass
+
+class InsufficientStockError(Exception):
+    pass
+
+class OrderNotFoundError(Exception):
+    pass
+
 def validate_password(password):
-    if re.fullmatch(r'^(?=.*[A-Za-z])(?=.*\d)[A-Za-z\d]{8,16}$', password):
+    if PASSWORD_PATTERN.fullmatch(password):
         return
     raise InvalidPasswordError("Password must be alphanumeric and between 8 to 16 characters.")
 
+def hash_password(password, iterations=None):
+    iterations = iterations or PASSWORD_ITERATIONS
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def is_password_hash(stored):
+    return stored.startswith('pbkdf2_sha256$')
+
+def verify_password(stored, password):
+    cache_key = verification_cache.digest(stored, password)
+    if cache_key in verification_cache:
+        return True
+    if is_password_hash(stored):
+        _, iterations, salt, expected = stored.split('$')
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), bytes.fromhex(salt), int(iterations))
+        verified = hmac.compare_digest(digest.hex(), expected)
+    else:
+        verified = hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+    if verified:
+        verification_cache.add(cache_key)
+    return verified
+
 def validate_shop_name(shop_name):
+    if not shop_name:
+        raise InvalidShopNameError("Shop name can't be empty.")
     if shop_name in inventories:
         raise InvalidShopNameError("Shop name is not available. Please choose a different shop name.")
 
+def validate_username(username):
+    if not username:
+        raise InvalidUsernameError("Username can't be empty.")
+    if username in accounts:
+        raise InvalidUsernameError("Username already exists.")
+
+def validate_role(role):
+    if role not in ['user', 'seller']:
+        raise InvalidRoleError("Invalid role.")
+
+def require_role(username, role):
+    if accounts[username]['role'] != role:
+        raise PermissionDeniedError(f"Only a {role} can do this.")
+
+def create_account(username, password, role, shop_name=None):
+    validate_username(username)
+    validate_password(password)
+    validate_role(role)
+    if role == 'seller':
+        validate_shop_name(shop_name)
+    else:
+        shop_name = None
+    # Hashing is the slow part, so it happens before taking the lock.
+    password_hash = hash_password(password)
+    with accounts_lock:
+        validate_username(username)
+        if role == 'seller':
+            validate_shop_name(shop_name)
+            inventories[shop_name] = {}
+        accounts[username] = {'password': password_hash, 'role': role, 'shop': shop_name}
+    save_account(username, password_hash, role, shop_name)
+    return accounts[username]
+
+def check_password(username, password):
+    login_throttle.check(username)
+    if verify_password(accounts[username]['password'], password):
+        login_throttle.reset(username)
+        return True
+    login_throttle.record_failure(username)
+    return False
+
+def authenticate(username, password):
+    if username not in accounts or not check_password(username, password):
+        raise LoginError("Invalid username or password.")
+    return username
+
+@timed()
+def add_product(shop_name, product, description, quantity, price):
+    # Prices from callers are already in centavos, files and the menu are read in pesos.
+    product, description, quantity, price = parse_stock_row(
+        {'product': product, 'description': description, 'quantity': quantity, 'price': price}, parse_cents)
+    inventory = inventories.setdefault(shop_name)
+
+    product_key = (product, description)
+    with stock_locks.hold(shop_name, product_key):
+        if product_key not in inventory:
+            inventory[product_key] = ProductRecord(0, price)
+
+        details = inventory[product_key]
+        details['quantity'] += quantity
+        inventory.touch()
+        inventory_sync.record(shop_name, product_key, quantity, details['price'])
+    return details
+
+def stock_product(username, product, description, quantity, price):
+    require_role(username, 'seller')
+    return add_product(accounts[username]['shop'], product, description, quantity, price)
+
+def iter_products(inventory, sort_by=None, descending=False, in_stock_only=False):
+    if sort_by is not None and sort_by not in SORT_FIELDS:
+        raise ValueError(f"Can't sort by {sort_by}, use one of: {', '.join(SORT_FIELDS)}.")
+    for (product, description), details in inventory.iter_sorted(sort_by, descending):
+        if not in_stock_only or details['quantity'] > 0:
+            yield product, description, details
+
+def product_rows(inventory, sort_by=None, descending=False, in_stock_only=False, offset=0, limit=None):
+    rows = iter_products(inventory, sort_by, descending, in_stock_only)
+    return [{'product': product, 'description': description, 'quantity': details['quantity'], 'price': details['price']}
+            for product, description, details in islice(rows, offset, None if limit is None else offset + limit)]
+
+def list_inventory(username, sort_by=None, descending=False, offset=0, limit=None):
+    require_role(username, 'seller')
+    return product_rows(inventories[accounts[username]['shop']], sort_by, descending, False, offset, limit)
+
+def list_products(sort_by=None, descending=False, offset=0, limit=None, shop_name=None):
+    shop_names = [shop_name] if shop_name is not None else inventories
+    return {name: product_rows(get_shop_inventory(name), sort_by, descending, True, offset, limit) for name in shop_names}
+
+def get_shop_inventory(shop_name):
+    if shop_name not in inventories:
+        raise InvalidShopNameError("Shop not found.")
+    return inventories[shop_name]
+
+def find_products(shop_name, product):
+    inventory = get_shop_inventory(shop_name)
+    return inventory.find(product) or inventory.find_casefold(product)
+
+def reserve_stock(shop_name, product_key, quantity):
+    inventory = get_shop_inventory(shop_name)
+    with stock_locks.hold(shop_name, product_key):
+        details = inventory.get(product_key)
+        if details is None:
+            raise ProductNotFoundError("Product not available.")
+        if quantity <= 0 or quantity > details['quantity']:
+            raise InsufficientStockError("Invalid quantity.")
+        details['quantity'] -= quantity
+        inventory.touch()
+        return details['price']
+
+def release_stock(shop_name, product_key, quantity):
+    with stock_locks.hold(shop_name, product_key):
+        # A product missing from memory has no stock in the table either, so there is nothing to give back.
+        inventory = inventories[shop_name]
+        details = inventory.get(product_key)
+        if details is not None:
+            details['quantity'] += quantity
+            inventory.touch()
+
+def queue_orders(orders):
+    # deliver_orders drops journal inserts under the same lock, so a dispatch that takes an order
+    # from the queue always finds its insert and can't have it written back after the delete.
+    with order_journal.lock:
+        for order in orders:
+            order_queue.append(order)
+        order_journal.record_inserts(orders)
+
+@timed()
+def place_order(username, shop_name, product, description, quantity, address):
+    price = reserve_stock(shop_name, (product, description), quantity)
+    order = OrderRecord(username, shop_name, address, product, description, quantity, price, quantity * price)
+    queue_orders([order])
+    return order
+
+@timed()
+def dispatch_order(username):
+    order = order_queue.pop_user(username)
+    if order is None:
+        return None
+    delivered = deliver_orders([order])
+    return delivered[0] if delivered else None
+
+def get_cart(username):
+    return carts.setdefault(username, Cart())
+
+@timed()
+def place_cart(username, cart, address):
+    lines = cart.items()
+    if not lines:
+        raise OrderNotFoundError("The cart is empty.")
+    shop_inventories = {shop_name: get_shop_inventory(shop_name) for (shop_name, _, _), _ in lines}
+    with ExitStack() as held:
+        for (shop_name, product, description), _ in lines:
+            held.enter_context(stock_locks.hold(shop_name, (product, description)))
+        # Every line is checked before any stock is taken, so a cart is reserved whole or not at all.
+        for (shop_name, product, description), quantity in lines:
+            details = shop_inventories[shop_name].get((product, description))
+            if details is None:
+                raise ProductNotFoundError(f"{product} ({description}) is not available at {shop_name}.")
+            if quantity > details['quantity']:
+                raise InsufficientStockError(f"Not enough {product} ({description}) left at {shop_name}.")
+        orders = []
+        for (shop_name, product, description), quantity in lines:
+            details = shop_inventories[shop_name][(product, description)]
+            details['quantity'] -= quantity
+            shop_inventories[shop_name].touch()
+            orders.append(OrderRecord(username, shop_name, address, product, description,
+                                      quantity, details['price'], quantity * details['price']))
+    queue_orders(orders)
+    return orders
+
+@timed()
+def dispatch_orders(username):
+    orders = []
+    while (order := order_queue.pop_user(username)) is not None:
+        orders.append(order)
+    if not orders:
+        return []
+    return deliver_orders(orders)
+
+def deliver_orders(orders):
+    # Stock, order rows and sales are written in one transaction, so a crash can never leave
+    # a delivered order pending in the database to be reserved and delivered again.
+    needed = {}
+    for order in orders:
+        line = (order['Shop'], (order['Product'], order['Description']))
+        needed[line] = needed.get(line, 0) + order['Quantity']
+
+    removed = []
+    with ExitStack() as held:
+        for shop_name, product_key in sorted(needed):
+            held.enter_context(stock_locks.hold(shop_name, product_key))
+        inventory_sync.flush_keys(sorted(needed))
+        try:
+            with order_journal.lock:
+                for order in orders:
+                    order_journal.inserts.pop(order['ID'], None)
+                with db_lock, conn:
+                    c = conn.cursor()
+                    for (shop_name, (product, description)), quantity in sorted(needed.items()):
+                        c.execute(UPDATE_INVENTORY_SQL, (quantity, shop_name, product, description, quantity))
+                        if c.rowcount == 0:
+                            raise InsufficientStockError(f"Not enough {product} ({description}) left in {shop_name} to deliver.")
+                    c.executemany(DELETE_ORDER_SQL, [(order['ID'],) for order in orders])
+                    delivered_at = time.strftime('%Y-%m-%d %H:%M:%S')
+                    for sql, rows in zip((SAVE_SALE_SQL, ROLLUP_DAILY_SALES_SQL, ROLLUP_PRODUCT_SALES_SQL),
+                                         sale_rows([(order, delivered_at) for order in orders])):
+                        c.executemany(sql, rows)
+                    for shop_name, product_key in sorted(needed):
+                        details = inventories[shop_name].get(product_key)
+                        if details is not None and details['quantity'] <= 0:
+                            c.execute(DELETE_PRODUCT_SQL, (shop_name, *product_key))
+                            if c.rowcount > 0:
+                                removed.append((shop_name, product_key))
+        except InsufficientStockError:
+            queue_orders(orders)
+            raise
+        except sqlite3.Error as e:
+            print(f"An error occurred while delivering orders: {e}")
+            queue_orders(orders)
+            return []
+        for shop_name, product_key in removed:
+            inventories[shop_name].pop(product_key)
+            print(f"Removed {product_key[0]} ({product_key[1]}) from {shop_name}'s inventory in the database.\n")
+
+    for order in orders:
+        delivery_scheduler.schedule(order)
+    return orders
+
+@timed()
+def cancel_order_by_id(username, order_id):
+    order = order_queue.take(order_id, username)
+    if order is None:
+        raise OrderNotFoundError("Order not found.")
+    order_journal.record_delete(order_id)
+    release_stock(order['Shop'], (order['Product'], order['Description']), order['Quantity'])
+    return order
+
+def list_orders(username):
+    return order_queue.user_orders(username)
+
+def arrived_orders(username):
+    return delivery_scheduler.arrived_orders(username)
+
+@timed()
+def pay_delivery(username, order_id, money):
+    order = delivery_scheduler.get(username, order_id)
+    if order is None:
+        raise OrderNotFoundError("Order not found.")
+    if money < order['Total']:
+        raise InsufficientFundsError("Insufficient funds. Please provide enough money.")
+    if delivery_scheduler.settle(username, order_id) is None:
+        raise OrderNotFoundError("Order not found.")
+    return money - order['Total']
+
+def pay_deliveries(username, money):
+    orders = arrived_orders(username)
+    if not orders:
+        raise OrderNotFoundError("No deliveries to pay for.")
+    if money < total([order['Quantity'] for order in orders], [order['Price'] for order in orders]):
+        raise InsufficientFundsError("Insufficient funds. Please provide enough money.")
+    settled = [order for order in orders if delivery_scheduler.settle(username, order['ID']) is not None]
+    return money - total([order['Quantity'] for order in settled], [order['Price'] for order in settled])
+
 def sign_up():
     while True:
         username = input("Enter a new username (or type 'back' to go back): ")
         if username.lower() == 'back':
             return
-        if username in accounts:
-            print("Username already exists. Try again.")
-        else:
+        try:
+            validate_username(username)
             break
+        except InvalidUsernameError as e:
+            print(f"{e} Try again.")
 
     while True:
         password = input("Enter a password: ")
@@ -46,10 +1075,11 @@ def sign_up():
         role = input("Enter role (user/seller) (or type 'back' to go back): ").lower()
         if role == 'back':
             return
-        if role in ['user', 'seller']:
+        try:
+            validate_role(role)
             break
-        else:
-            print("Invalid role. Try again.")
+        except InvalidRoleError as e:
+            print(f"{e} Try again.")
 
     shop_name = None
     if role == 'seller':
@@ -59,14 +1089,12 @@ def sign_up():
                 return
             try:
                 validate_shop_name(shop_name)
-                inventories[shop_name] = {}
                 break
             except InvalidShopNameError as e:
                 print(e)
                 print("Please try again.")
 
-    accounts[username] = {'password': password, 'role': role, 'shop': shop_name}
-    save_account(username, password, role, shop_name)
+    create_account(username, password, role, shop_name)
     print(f"Account created for {username} as {role}.\n")
 
 def log_in():
@@ -83,10 +1111,13 @@ def log_in():
         password = input("Enter your password (or type 'back' to go back): ")
         if password.lower() == 'back':
             return None
-        if accounts[username]['password'] != password:
+        try:
+            if check_password(username, password):
+                break
             print("Incorrect password. Try again.")
-        else:
-            break
+        except LoginThrottledError as e:
+            print(e)
+            return None
 
     print(f"Welcome, {username}.\n")
     return username
@@ -98,6 +1129,7 @@ def log_out():
 def switch_account():
     return log_in()
 
+@timed()
 def add_stock(username):
   shop_name = accounts[username]['shop']
   while True:
@@ -126,55 +1158,242 @@ def add_stock(username):
         break
 
     try:
-      price = float(input("Enter product price (or type 'back' to go back): "))
+      price = to_cents(input("Enter product price (or type 'back' to go back): "))
       if price < 0:
         raise ValueError
     except ValueError:
       print("Invalid price. Try again.")
       continue
 
-    
-    if shop_name not in inventories:
-      inventories[shop_name] = {}
-
-    product_key = (product, description)
-    if product_key not in inventories[shop_name]:
-      inventories[shop_name][product_key] = {'quantity': 0, 'price': price}
-    
-    inventories[shop_name][product_key]['quantity'] += quantity
-    save_inventory(shop_name, product, description, inventories[shop_name][product_key]['quantity'], price)
+    add_product(shop_name, product, description, quantity, price)
     print(f"Added {quantity} {product}(s) to the inventory of {shop_name}.\n")
     break
 
+def parse_stock_row(row, parse_price=to_cents):
+    if not isinstance(row, dict):
+        raise InvalidProductError("Malformed row.")
+    product = str(row.get('product') or '')
+    description = str(row.get('description') or '')
+    if not product:
+        raise InvalidProductError("Product name can't be empty.")
+    if not description:
+        raise InvalidProductError("Product description can't be empty.")
+    try:
+        quantity = int(row.get('quantity'))
+        if quantity < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise InvalidProductError("Invalid quantity.")
+    try:
+        price = parse_price(row.get('price'))
+        if price < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise InvalidProductError("Invalid price.")
+    return product, description, quantity, price
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.json')):
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        else:
+            yield from csv.DictReader(f)
+
+@timed()
+def import_stock(shop_name, path, chunk_size=STOCK_IMPORT_CHUNK_SIZE):
+    start = time.perf_counter()
+    imported = rejected = 0
+    rows = enumerate(read_rows(path), 1)
+    # Pinned, so other loads can't evict the shop between chunks while its rows are still being added.
+    with inventories.pinned(shop_name) as inventory:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            for row_number, row in chunk:
+                try:
+                    product, description, quantity, price = parse_stock_row(row)
+                except ValueError as e:
+                    rejected += 1
+                    print(f"Row {row_number} rejected: {e}")
+                    continue
+                product_key = (product, description)
+                with stock_locks.hold(shop_name, product_key):
+                    if product_key not in inventory:
+                        inventory[product_key] = ProductRecord(0, price)
+                    inventory[product_key]['quantity'] += quantity
+                    inventory.touch()
+                    # The chunk is written in one flush below, not every INVENTORY_FLUSH_SIZE rows.
+                    inventory_sync.record(shop_name, product_key, quantity, inventory[product_key]['price'], auto_flush=False)
+                imported += 1
+            inventory_sync.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = imported / elapsed if elapsed > 0 else 0
+    print(f"Imported {imported} row(s) into {shop_name} ({rejected} rejected) in {elapsed:.2f}s ({rate:.0f} rows/s).\n")
+    return imported, rejected
+
+def sales_report(username):
+    shop_name = accounts[username]['shop']
+    inventory_sync.flush()
+    order_journal.flush()
+    with pool.reader() as reader:
+        lines = analytics.report_lines(reader, shop_name)
+    print(f"\nSales Report for {shop_name}:")
+    print("\n".join(lines) + "\n")
+
+def import_stock_from_file(username):
+    shop_name = accounts[username]['shop']
+    while True:
+        path = input("Enter the CSV or JSONL file path (or type 'back' to go back): ")
+        if path.lower() == 'back':
+            return
+        try:
+            import_stock(shop_name, path)
+            return
+        except OSError as e:
+            print(f"Could not read file: {e}")
+            print("Please try again.")
 
-def check_inventory(username):
+def parse_account_row(row, usernames, shop_names):
+    if not isinstance(row, dict):
+        raise ValueError("Malformed row.")
+    username = str(row.get('username') or '')
+    password = str(row.get('password') or '')
+    role = str(row.get('role') or '').lower()
+    shop_name = str(row.get('shop_name') or '') or None
+    validate_username(username)
+    if username in usernames:
+        raise InvalidUsernameError("Username already exists.")
+    validate_password(password)
+    validate_role(role)
+    if role == 'seller':
+        validate_shop_name(shop_name)
+        if shop_name in shop_names:
+            raise InvalidShopNameError("Shop name is not available. Please choose a different shop name.")
+    else:
+        shop_name = None
+    return username, password, role, shop_name
+
+def provision_accounts(rows, chunk_size=ACCOUNT_IMPORT_CHUNK_SIZE):
+    start = time.perf_counter()
+    created = []
+    rejected = []
+    usernames = set()
+    shop_names = set()
+    rows = enumerate(rows, 1)
+    with ThreadPoolExecutor(max_workers=ACCOUNT_HASH_WORKERS) as hashers, UnitOfWork() as work:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            valid = []
+            for row_number, row in chunk:
+                try:
+                    username, password, role, shop_name = parse_account_row(row, usernames, shop_names)
+                except (ValueError, InvalidUsernameError, InvalidPasswordError, InvalidRoleError, InvalidShopNameError) as e:
+                    rejected.append((row_number, str(e)))
+                    continue
+                usernames.add(username)
+                if shop_name is not None:
+                    shop_names.add(shop_name)
+                valid.append((username, password, role, shop_name))
+
+            # pbkdf2_hmac releases the GIL, so hashing spreads over the worker threads.
+            hashes = hashers.map(hash_password, [password for _, password, _, _ in valid])
+            with accounts_lock:
+                for (username, _, role, shop_name), password_hash in zip(valid, hashes):
+                    if shop_name is not None:
+                        inventories[shop_name] = {}
+                    accounts[username] = {'password': password_hash, 'role': role, 'shop': shop_name}
+                    save_account(username, password_hash, role, shop_name)
+                    created.append((username, shop_name))
+
+    for row_number, reason in rejected:
+        print(f"Row {row_number} rejected: {reason}")
+    if work.committed is False:
+        # Nothing reached the database, so the accounts and shops added in memory go too.
+        with accounts_lock:
+            for username, shop_name in created:
+                accounts.pop(username, None)
+                if shop_name is not None:
+                    del inventories[shop_name]
+        print("No accounts were created.\n")
+        return 0, rejected
+
+    elapsed = time.perf_counter() - start
+    rate = len(created) / elapsed if elapsed > 0 else 0
+    print(f"Created {len(created)} account(s) ({len(rejected)} rejected) in {elapsed:.2f}s ({rate:.0f} accounts/s).\n")
+    return len(created), rejected
+
+def import_accounts(path):
+    return provision_accounts(read_rows(path))
+
+PRODUCT_HEADER = "{:<20} {:<20} {:<10} {:<10}".format('Product', 'Description', 'Quantity', 'Price') + "\n" + "-" * 70
+
+def product_lines(inventory, sort_by=None, descending=False, in_stock_only=False):
+    for product, description, details in iter_products(inventory, sort_by, descending, in_stock_only):
+        yield "{:<20} {:<20} {:<10} ₱{:<10}".format(product, description, details['quantity'], format_cents(details['price']))
+
+def pages(lines, page_size=PAGE_SIZE, offset=0):
+    lines = islice(lines, offset, None)
+    while True:
+        page = list(islice(lines, page_size))
+        if not page:
+            return
+        yield page
+
+def write_lines(lines):
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def show_pages(title, lines, page_size=PAGE_SIZE, pause=None):
+    shown = False
+    for page in pages(lines, page_size):
+        if not shown:
+            write_lines([title, PRODUCT_HEADER])
+            shown = True
+        write_lines(page)
+        if pause is not None and len(page) == page_size and not pause():
+            return shown, False
+    return shown, True
+
+def prompt_more():
+    return input("Press Enter for more (or type 'back' to stop): ").lower() != 'back'
+
+def prompt_sort():
+    while True:
+        sort_by = input("Sort by name, price or quantity (press Enter to skip): ").lower()
+        if not sort_by:
+            return None
+        if sort_by in SORT_FIELDS:
+            return sort_by
+        print("Invalid sort option. Try again.")
+
+def check_inventory(username, sort_by=None, pause=None):
     shop_name = accounts[username]['shop']
-    if not inventories[shop_name]:
+    title = f"\nCurrent Inventory of {shop_name}:"
+    shown, _ = show_pages(title, product_lines(inventories[shop_name], sort_by), pause=pause)
+    if not shown:
         print("Inventory is empty.\n")
         return
-
-    print(f"\nCurrent Inventory of {shop_name}:")
-    print("{:<20} {:<20} {:<10} {:<10}".format('Product', 'Description', 'Quantity', 'Price'))
-    print("-" * 70)
-    for (product, description), details in inventories[shop_name].items():
-        print("{:<20} {:<20} {:<10} ₱{:<10.2f}".format(product, description, details['quantity'], details['price']))
     print()
 
-def display_available_products():
+def display_available_products(sort_by=None, pause=None):
     if not inventories:
         print("No products available.")
         return
 
-    shop_list = list(inventories.keys())
-    for idx, shop_name in enumerate(shop_list):
-        inventory = inventories[shop_name]
-        if inventory:
-            print(f"\n{idx + 1}. Available Products at {shop_name}:")
-            print("{:<20} {:<20} {:<10} {:<10}".format('Product', 'Description', 'Quantity', 'Price'))
-            print("-" * 70)
-            for (product, description), details in inventory.items():
-                if details['quantity'] > 0:
-                    print("{:<20} {:<20} {:<10} ₱{:<10.2f}".format(product, description, details['quantity'], details['price']))
+    for idx, shop_name in enumerate(inventories):
+        title = f"\n{idx + 1}. Available Products at {shop_name}:"
+        _, finished = show_pages(title, product_lines(inventories[shop_name], sort_by, in_stock_only=True), pause=pause)
+        if not finished:
+            return
 
 def select_shop():
     print("\nAvailable Shops:")
@@ -190,11 +1409,8 @@ def select_shop():
             shop_index = int(shop_index) - 1
             if 0 <= shop_index < len(shop_list):
                 shop_name = shop_list[shop_index]
-                print(f"\nProducts available at {shop_name}:")
-                print("{:<20} {:<20} {:<10} {:<10}".format('Product', 'Description', 'Quantity', 'Price'))
-                print("-" * 70)
-                for (product, description), details in inventories[shop_name].items():
-                    print("{:<20} {:<20} {:<10} ₱{:<10.2f}".format(product, description, details['quantity'], details['price']))
+                title = f"\nProducts available at {shop_name}:"
+                show_pages(title, product_lines(inventories[shop_name], in_stock_only=True), pause=prompt_more)
                 return shop_name
             else:
                 print("Invalid selection. Try again.")
@@ -202,55 +1418,69 @@ def select_shop():
             print("Invalid input. Please enter a number.")
 
 class OrderSystem:
-    def check_out_order(self, username):
+    def prompt_product(self, shop_name):
         while True:  
-            shop_name = select_shop()
-            if not shop_name:
-                return
-
-            while True:  
-                product = input("Product (or type 'back' to go back): ")
-                if product.lower() == 'back':
-                    break
-
-                matching_products = [(p, d) for (p, d) in inventories[shop_name] if p == product]
-                if not matching_products:
+            product = input("Product (or type 'back' to go back): ")
+            if product.lower() == 'back':
+                return None
+
+            matching_products = find_products(shop_name, product)
+            if not matching_products:
+                suggestions = inventories[shop_name].search_prefix(product)
+                if suggestions:
+                    print(f"Product not available. Did you mean: {', '.join(suggestions)}?")
+                else:
                     print("Product not available. Try again.")
-                    continue
+                continue
 
+            
+            if len(matching_products) > 1:
+                print(f"Multiple descriptions found for {product}:")
+                for idx, (p, d) in enumerate(matching_products):
+                    print(f"{idx + 1}. {d}")
                 
-                if len(matching_products) > 1:
-                    print(f"Multiple descriptions found for {product}:")
-                    for idx, (p, d) in enumerate(matching_products):
-                        print(f"{idx + 1}. {d}")
-                    
-                    while True:  # Loop for description selection
-                        try:
-                            choice = int(input("Select the description number: ")) - 1
-                            if choice < 0 or choice >= len(matching_products):
-                                raise ValueError
-                            selected_product = matching_products[choice]
-                            break  
-                        except ValueError:
-                            print("Invalid selection. Try again.")
-
-                else:
-                    selected_product = matching_products[0]  
-
-                while True:  
+                while True:  # Loop for description selection
                     try:
-                        quantity_input = input("Quantity (or type 'back' to go back): ")
-                        if quantity_input.lower() == 'back':
-                            break  
-                        quantity = int(quantity_input)  
-                        if quantity <= 0 or quantity > inventories[shop_name][selected_product]['quantity']:
+                        choice = int(input("Select the description number: ")) - 1
+                        if choice < 0 or choice >= len(matching_products):
                             raise ValueError
+                        selected_product = matching_products[choice]
                         break  
                     except ValueError:
-                        print("Invalid quantity. Try again.")
+                        print("Invalid selection. Try again.")
 
-                if quantity_input.lower() == 'back':  
-                    continue  
+            else:
+                selected_product = matching_products[0]  
+
+            while True:  
+                try:
+                    quantity_input = input("Quantity (or type 'back' to go back): ")
+                    if quantity_input.lower() == 'back':
+                        break  
+                    quantity = int(quantity_input)  
+                    if quantity <= 0 or quantity > inventories[shop_name][selected_product]['quantity']:
+                        raise ValueError
+                    break  
+                except ValueError:
+                    print("Invalid quantity. Try again.")
+
+            if quantity_input.lower() == 'back':  
+                continue  
+
+            return selected_product, quantity
+
+    @timed()
+    def check_out_order(self, username):
+        while True:  
+            shop_name = select_shop()
+            if not shop_name:
+                return
+
+            while True:  
+                selection = self.prompt_product(shop_name)
+                if selection is None:
+                    break
+                selected_product, quantity = selection
 
                 
                 address = input("Address (or type 'back' to go back): ")
@@ -258,49 +1488,84 @@ class OrderSystem:
                     continue  
 
                 
-                order = {
-                    'Name': username,
-                    'Shop': shop_name,
-                    'Address': address,
-                    'Product': selected_product[0],
-                    'Description': selected_product[1],
-                    'Quantity': quantity,
-                    'Price': inventories[shop_name][selected_product]['price'],
-                    'Total': quantity * inventories[shop_name][selected_product]['price']
-                }
-                order_queue.append(order)
-                inventories[shop_name][selected_product]['quantity'] -= quantity
-                print(f"Order placed: {quantity} x {product} (₱{order['Price']:.2f} each) from {shop_name}.\n")
+                order = place_order(username, shop_name, selected_product[0], selected_product[1], quantity, address)
+                print(f"Order placed: {quantity} x {order['Product']} (₱{format_cents(order['Price'])} each) from {shop_name}.\n")
                 break
 
-    def deliver_order(self, username):
-        user_orders = [order for order in order_queue if order['Name'] == username]
-        if user_orders:
-            delivered_order = user_orders.pop(0)
-            order_queue.remove(delivered_order)
-
-            
-            shop_name = delivered_order['Shop']
-            product = delivered_order['Product']
-            description = delivered_order['Description']
-            quantity = delivered_order['Quantity']
+    @timed()
+    def check_out_cart(self, username):
+        cart = get_cart(username)
+        while True:
+            shop_name = select_shop()
+            if not shop_name:
+                break
+            selection = self.prompt_product(shop_name)
+            if selection is not None:
+                (product, description), quantity = selection
+                cart.add(shop_name, product, description, quantity)
+                print(f"Added {quantity} x {product} from {shop_name} to your cart ({len(cart)} item(s)).\n")
+
+        if not len(cart):
+            print("Your cart is empty.\n")
+            return
+        print("\nYour Cart:")
+        for (shop_name, product, description), quantity in cart.items():
+            print(f"{quantity} x {product} ({description}) from {shop_name}")
+        address = input("Address (or type 'back' to keep shopping later): ")
+        if address.lower() == 'back':
+            return
+        try:
+            orders = place_cart(username, cart, address)
+        except (ProductNotFoundError, InsufficientStockError) as e:
+            print(f"{e} Your cart was kept.\n")
+            return
+        cart.clear()
+        amount = total([order['Quantity'] for order in orders], [order['Price'] for order in orders])
+        print(f"Order placed: {len(orders)} item(s) for ₱{format_cents(amount)}.\n")
 
-            
-            update_inventory_in_database(shop_name, product, description, quantity)
-            
+    @timed()
+    def deliver_order(self, username):
+        try:
+            delivered_order = dispatch_order(username)
+        except InsufficientStockError as e:
+            print(f"{e}\n")
+            return
+        if delivered_order:
+            print(f"Delivering {delivered_order['Name']}'s order from {delivered_order['Shop']} at {delivered_order['Address']}...")
+            print(f"Total price: ₱{format_cents(delivered_order['Total'])}")
+            print("You will be asked for payment once it arrives.\n")
+        else:
+            print("No orders to deliver.\n")
 
+    @timed()
+    def deliver_all_orders(self, username):
+        try:
+            delivered_orders = dispatch_orders(username)
+        except InsufficientStockError as e:
+            print(f"{e}\n")
+            return
+        if not delivered_orders:
+            print("No orders to deliver.\n")
+            return
+        amount = total([order['Quantity'] for order in delivered_orders], [order['Price'] for order in delivered_orders])
+        print(f"Delivering {len(delivered_orders)} order(s) to {username}...")
+        print(f"Total price: ₱{format_cents(amount)}")
+        print("You will be asked for payment once they arrive.\n")
+
+    @timed()
+    def settle_deliveries(self, username):
+        delivered_orders = arrived_orders(username)
+        if len(delivered_orders) > 1:
+            self.settle_all(username, delivered_orders)
+            return
+        for delivered_order in delivered_orders:
             total_price = delivered_order['Total']
-            print(f"Delivering {delivered_order['Name']}'s order from {delivered_order['Shop']} at {delivered_order['Address']}...")
-            print(f"Total price: ₱{total_price:.2f}")
-            time.sleep(3)  
-            print(f"Order Delivered: {delivered_order['Quantity']} x {delivered_order['Product']} (₱{delivered_order['Price']:.2f} each) from {delivered_order['Shop']}.\n")
+            print(f"Order Delivered: {delivered_order['Quantity']} x {delivered_order['Product']} (₱{format_cents(delivered_order['Price'])} each) from {delivered_order['Shop']}.")
+            print(f"Total price: ₱{format_cents(total_price)}\n")
 
             while True:
                 try:
-                    money = float(input("Enter your money: "))
-                    if money < total_price:
-                        raise InsufficientFundsError("Insufficient funds. Please provide enough money.")
-                    change = money - total_price
+                    change = pay_delivery(username, delivered_order['ID'], to_cents(input("Enter your money: ")))
                     break
                 except ValueError:
                     print("Invalid input. Please enter a valid amount.")
@@ -308,18 +1573,30 @@ class OrderSystem:
                     print(e)
             
             print(f"The order of {delivered_order['Name']} from {delivered_order['Shop']} at {delivered_order['Address']} has been delivered.\n")
-            print(f"Change: ₱{change:.2f}")
+            print(f"Change: ₱{format_cents(change)}")
 
-            
-            product_key = (product, description)
-            if inventories[shop_name][product_key]['quantity'] <= 0:
-                inventories[shop_name].pop(product_key)
-                delete_product_from_database(shop_name, product, description)
-        else:
-            print("No orders to deliver.\n")
+    def settle_all(self, username, delivered_orders):
+        # One payment covers every order that has arrived.
+        for delivered_order in delivered_orders:
+            print(f"Order Delivered: {delivered_order['Quantity']} x {delivered_order['Product']} (₱{format_cents(delivered_order['Price'])} each) from {delivered_order['Shop']}.")
+        amount = total([order['Quantity'] for order in delivered_orders], [order['Price'] for order in delivered_orders])
+        print(f"Total price: ₱{format_cents(amount)}\n")
 
+        while True:
+            try:
+                change = pay_deliveries(username, to_cents(input("Enter your money: ")))
+                break
+            except ValueError:
+                print("Invalid input. Please enter a valid amount.")
+            except InsufficientFundsError as e:
+                print(e)
+
+        print(f"{len(delivered_orders)} order(s) of {username} have been delivered.\n")
+        print(f"Change: ₱{format_cents(change)}")
+
+    @timed()
     def cancel_order(self, username):
-        user_orders = [order for order in order_queue if order['Name'] == username]
+        user_orders = list_orders(username)
         if user_orders:
             print("\nYour Orders:")
             for i, order in enumerate(user_orders):
@@ -338,40 +1615,41 @@ class OrderSystem:
                 except ValueError:
                     print("Invalid choice. Please enter a valid number.")
 
-            order_queue.remove(canceled_order)
-            inventories[canceled_order['Shop']][(canceled_order['Product'], canceled_order['Description'])]['quantity'] += canceled_order['Quantity']
+            cancel_order_by_id(username, canceled_order['ID'])
             print(f"Order for {canceled_order['Product']} ({canceled_order['Quantity']}) from {canceled_order['Shop']} has been canceled.\n")
 
         else:
             print("No orders to cancel.\n")
 
+    @timed()
     def display_orders(self, username):
-        user_orders = [order for order in order_queue if order['Name'] == username]
+        user_orders = list_orders(username)
         if user_orders:
             print(f"\nOrders for {username}:")
             print("{:<20} {:<20} {:<10} {:<10} {:<10}".format('Shop', 'Product', 'Description', 'Quantity', 'Total'))
             print("-" * 70)
             for order in user_orders:
-                print("{:<20} {:<20} {:<10} {:<10} ₱{:<10.2f}".format(
-                    order['Shop'], order['Product'], order['Description'], order['Quantity'], order['Total']
+                print("{:<20} {:<20} {:<10} {:<10} ₱{:<10}".format(
+                    order['Shop'], order['Product'], order['Description'], order['Quantity'], format_cents(order['Total'])
                 ))
+            amount = total([order['Quantity'] for order in user_orders], [order['Price'] for order in user_orders])
+            print(f"{'Total':<63} ₱{format_cents(amount)}\n")
         else:
             print("No orders to display.\n")
 
-def initialize_database():
-    global conn  
-    try:
-        conn = sqlite3.connect('shop_system.db')
-        c = conn.cursor()        
-        c.execute('''
+# Each entry moves the schema forward by one version. Entries only ever get appended, and the early ones
+# use IF NOT EXISTS because they also run against databases created before versioning.
+MIGRATIONS = [
+    [
+        '''
             CREATE TABLE IF NOT EXISTS accounts (
                 username TEXT PRIMARY KEY,
                 password TEXT NOT NULL,
                 role TEXT NOT NULL,
                 shop_name TEXT
             )
-        ''')
-        c.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS inventories (
                 shop_name TEXT NOT NULL,
                 product TEXT NOT NULL,
@@ -380,8 +1658,8 @@ def initialize_database():
                 price REAL NOT NULL,
                 PRIMARY KEY (shop_name, product, description)
             )
-        ''')
-        c.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS orders (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 username TEXT NOT NULL,
@@ -393,178 +1671,620 @@ def initialize_database():
                 price REAL NOT NULL,
                 total REAL NOT NULL
             )
-        ''')
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"An error occurred while initializing the database: {e}")
-
-def load_data():
-    conn = sqlite3.connect('shop_system.db')
+        '''
+    ],
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS sales (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                shop_name TEXT NOT NULL,
+                product TEXT NOT NULL,
+                description TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price REAL NOT NULL,
+                total REAL NOT NULL,
+                day TEXT NOT NULL,
+                delivered_at TEXT NOT NULL
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS sales_shop_day ON sales (shop_name, day)',
+        'CREATE INDEX IF NOT EXISTS sales_order_id ON sales (order_id)',
+        '''
+            CREATE TABLE IF NOT EXISTS daily_sales (
+                day TEXT NOT NULL,
+                shop_name TEXT NOT NULL,
+                orders INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                PRIMARY KEY (day, shop_name)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS daily_sales_shop ON daily_sales (shop_name, day)',
+        '''
+            CREATE TABLE IF NOT EXISTS product_sales (
+                shop_name TEXT NOT NULL,
+                product TEXT NOT NULL,
+                description TEXT NOT NULL,
+                orders INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                PRIMARY KEY (shop_name, product, description)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS product_sales_quantity ON product_sales (quantity)'
+    ],
+    [
+        'CREATE INDEX orders_username ON orders (username)',
+        'CREATE INDEX orders_shop_name ON orders (shop_name)'
+    ],
+    [
+        'CREATE TABLE seeds (name TEXT PRIMARY KEY, applied_at TEXT NOT NULL)'
+    ],
+    # Money moves to integer centavos. SQLite only changes a column's type by rebuilding the table.
+    [
+        '''
+            CREATE TABLE inventories_cents (
+                shop_name TEXT NOT NULL,
+                product TEXT NOT NULL,
+                description TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                PRIMARY KEY (shop_name, product, description)
+            )
+        ''',
+        '''
+            INSERT INTO inventories_cents
+            SELECT shop_name, product, description, quantity, CAST(ROUND(price * 100) AS INTEGER) FROM inventories
+        ''',
+        'DROP TABLE inventories',
+        'ALTER TABLE inventories_cents RENAME TO inventories',
+        '''
+            CREATE TABLE orders_cents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                shop_name TEXT NOT NULL,
+                address TEXT NOT NULL,
+                product TEXT NOT NULL,
+                description TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                total INTEGER NOT NULL
+            )
+        ''',
+        '''
+            INSERT INTO orders_cents
+            SELECT id, username, shop_name, address, product, description, quantity,
+                   CAST(ROUND(price * 100) AS INTEGER), CAST(ROUND(price * 100) AS INTEGER) * quantity
+            FROM orders
+        ''',
+        'DROP TABLE orders',
+        'ALTER TABLE orders_cents RENAME TO orders',
+        'CREATE INDEX orders_username ON orders (username)',
+        'CREATE INDEX orders_shop_name ON orders (shop_name)',
+        '''
+            CREATE TABLE sales_cents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                shop_name TEXT NOT NULL,
+                product TEXT NOT NULL,
+                description TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                delivered_at TEXT NOT NULL
+            )
+        ''',
+        '''
+            INSERT INTO sales_cents
+            SELECT id, order_id, username, shop_name, product, description, quantity,
+                   CAST(ROUND(price * 100) AS INTEGER), CAST(ROUND(price * 100) AS INTEGER) * quantity, day, delivered_at
+            FROM sales
+        ''',
+        'DROP TABLE sales',
+        'ALTER TABLE sales_cents RENAME TO sales',
+        'CREATE INDEX sales_shop_day ON sales (shop_name, day)',
+        'CREATE INDEX sales_order_id ON sales (order_id)',
+        '''
+            CREATE TABLE daily_sales_cents (
+                day TEXT NOT NULL,
+                shop_name TEXT NOT NULL,
+                orders INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                revenue INTEGER NOT NULL,
+                PRIMARY KEY (day, shop_name)
+            )
+        ''',
+        '''
+            INSERT INTO daily_sales_cents
+            SELECT day, shop_name, COUNT(*), SUM(quantity), SUM(total) FROM sales GROUP BY day, shop_name
+        ''',
+        'DROP TABLE daily_sales',
+        'ALTER TABLE daily_sales_cents RENAME TO daily_sales',
+        'CREATE INDEX daily_sales_shop ON daily_sales (shop_name, day)',
+        '''
+            CREATE TABLE product_sales_cents (
+                shop_name TEXT NOT NULL,
+                product TEXT NOT NULL,
+                description TEXT NOT NULL,
+                orders INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                revenue INTEGER NOT NULL,
+                PRIMARY KEY (shop_name, product, description)
+            )
+        ''',
+        '''
+            INSERT INTO product_sales_cents
+            SELECT shop_name, product, description, COUNT(*), SUM(quantity), SUM(total)
+            FROM sales GROUP BY shop_name, product, description
+        ''',
+        'DROP TABLE product_sales',
+        'ALTER TABLE product_sales_cents RENAME TO product_sales',
+        'CREATE INDEX product_sales_quantity ON product_sales (quantity)'
+    ]
+]
+
+class ConnectionPool:
+    # One writer connection, serialized by db_lock, and up to `size` read-only connections for loads and listings.
+    # A thread gets back the reader it used last when that one is idle, so its page cache stays warm.
+    # Every connection keeps a statement cache, so the constant SQL strings are only prepared once per connection.
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self.writer = self.connect(db_path)
+        self.idle = []
+        self.opened = 0
+        self.affinity = threading.local()
+        self.condition = threading.Condition()
+        self.acquisitions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def connect(self, database, uri=False):
+        return sqlite3.connect(database, uri=uri, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+
+    def open_reader(self):
+        reader = self.connect(f'file:{os.path.abspath(self.db_path)}?mode=ro', uri=True)
+        reader.execute('PRAGMA query_only = ON')
+        return reader
+
+    def acquire(self):
+        with self.condition:
+            self.acquisitions += 1
+            if not self.idle and self.opened >= self.size:
+                self.waits += 1
+                began = time.perf_counter()
+                while not self.idle:
+                    self.condition.wait()
+                self.wait_time += time.perf_counter() - began
+            if self.idle:
+                last = getattr(self.affinity, 'reader', None)
+                reader = last if last in self.idle else self.idle[-1]
+                self.idle.remove(reader)
+            else:
+                self.opened += 1
+                reader = None
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        if reader is None:
+            try:
+                reader = self.open_reader()
+            except sqlite3.Error:
+                self.release(None)
+                raise
+        self.affinity.reader = reader
+        return reader
+
+    def release(self, reader):
+        with self.condition:
+            self.in_use -= 1
+            if reader is None:
+                self.opened -= 1
+            else:
+                self.idle.append(reader)
+            self.condition.notify()
+
+    @contextmanager
+    def reader(self):
+        if self.db_path == ':memory:':
+            with db_lock:
+                yield self.writer
+            return
+        reader = self.acquire()
+        try:
+            yield reader
+        finally:
+            self.release(reader)
+
+    def metrics(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'opened': self.opened,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'acquisitions': self.acquisitions,
+                'waits': self.waits,
+                'saturation': self.waits / self.acquisitions if self.acquisitions else 0.0,
+                'wait_time': self.wait_time
+            }
+
+    def close(self):
+        with self.condition:
+            for reader in self.idle:
+                reader.close()
+            self.idle = []
+        with db_lock:
+            self.writer.close()
+
+def initialize_database(db_path=DB_PATH, pool_size=DB_POOL_SIZE):
+    global conn, pool
+    pool = ConnectionPool(db_path, pool_size)
+    conn = pool.writer
     c = conn.cursor()
+    c.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+    c.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+    c.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at TEXT NOT NULL)')
+    version = c.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        # sqlite3 only opens a transaction on its own before DML, so CREATE and DROP would commit one by one.
+        # An explicit BEGIN applies each migration whole or not at all, and a failed one stops startup.
+        try:
+            c.execute('BEGIN')
+            for sql in statements:
+                c.execute(sql)
+            c.execute('INSERT INTO schema_version (version, applied_at) VALUES (?, ?)',
+                      (number, time.strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Migration {number} failed, the database is still at version {number - 1}: {e}")
+            raise
+
+@timed()
+def load_data():
+    with pool.reader() as reader:
+        load_rows(reader.cursor())
 
-    c.execute('SELECT * FROM accounts')
-    for row in c.fetchall():
-        username, password, role, shop_name = row
-        accounts[username] = {'password': password, 'role': role, 'shop': shop_name}
-
-    c.execute('SELECT * FROM inventories')
-    for row in c.fetchall():
-        shop_name, product, description, quantity, price = row
-        if shop_name not in inventories:
-            inventories[shop_name] = {}
-        inventories[shop_name][(product, description)] = {'quantity': quantity, 'price': price}
+def load_rows(c):
 
-    conn.close()
+    for (shop_name,) in c.execute('SELECT DISTINCT shop_name FROM inventories'):
+        inventories.register(shop_name)
 
-def save_account(username, password, role, shop_name):
+    plaintext = []
+    for username, password, role, shop_name in c.execute('SELECT username, password, role, shop_name FROM accounts'):
+        accounts[username] = {'password': password, 'role': role, 'shop': shop_name}
+        if shop_name is not None:
+            inventories.register(shop_name)
+        if not is_password_hash(password):
+            plaintext.append(username)
+
+    # Accounts saved before passwords were hashed are migrated in one transaction.
+    with UnitOfWork():
+        for username in plaintext:
+            account = accounts[username]
+            account['password'] = hash_password(account['password'])
+            save_account(username, account['password'], account['role'], account['shop'])
+
+    c.execute('SELECT id, username, shop_name, address, product, description, quantity, price, total FROM orders ORDER BY id')
+    for row in c:
+        order_id, username, shop_name, address, product, description, quantity, price, total = row
+        order_queue.append(OrderRecord(username, shop_name, address, product, description,
+                                       quantity, price, total, order_id))
+
+    # Delivered orders leave the orders table, so their IDs are only remembered by the sequence and the sales.
+    c.execute('''
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'orders'), 0),
+                   COALESCE((SELECT MAX(order_id) FROM sales), 0))
+    ''')
+    order_queue.next_id = max(order_queue.next_id, c.fetchone()[0] + 1)
+
+class UnitOfWork:
+    def __init__(self):
+        self.batches = []
+        self.outer = None
+        self.committed = None
+
+    def add(self, sql, params):
+        # Consecutive writes of the same statement share one executemany call.
+        if self.batches and self.batches[-1][0] == sql:
+            self.batches[-1][1].append(params)
+        else:
+            self.batches.append((sql, [params]))
+
+    def __enter__(self):
+        self.outer = active_work()
+        if self.outer is None:
+            work_state.current = self
+        return active_work()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.outer is not None or active_work() is not self:
+            return False
+        work_state.current = None
+        if exc_type is None:
+            self.commit()
+        return False
+
+    @timed()
+    def commit(self):
+        self.committed = True
+        if self.batches:
+            try:
+                with db_lock, conn:
+                    c = conn.cursor()
+                    for sql, rows in self.batches:
+                        c.executemany(sql, rows)
+            except sqlite3.Error as e:
+                print(f"An error occurred while committing batched writes: {e}")
+                self.committed = False
+        self.batches = []
+        return self.committed
+
+def active_work():
+    return getattr(work_state, 'current', None)
+
+@timed()
+def execute_write(sql, params, action):
+    work = active_work()
+    if work is not None:
+        work.add(sql, params)
+        return True
     try:
-        c = conn.cursor() 
-        c.execute('''
-            INSERT OR REPLACE INTO accounts (username, password, role, shop_name)
-            VALUES (?, ?, ?, ?)
-        ''', (username, password, role, shop_name))
-        conn.commit()
+        with db_lock:
+            c = conn.cursor()
+            c.execute(sql, params)
+            conn.commit()
+        return True
     except sqlite3.Error as e:
-        print(f"An error occurred while saving account data: {e}")
+        print(f"An error occurred while {action}: {e}")
+        return False
+
+SAVE_ACCOUNT_SQL = '''
+    INSERT OR REPLACE INTO accounts (username, password, role, shop_name)
+    VALUES (?, ?, ?, ?)
+'''
+
+SAVE_INVENTORY_SQL = '''
+    INSERT OR REPLACE INTO inventories (shop_name, product, description, quantity, price)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# The table holds physical stock while memory holds what is left after reservations,
+# so added stock is applied as a delta rather than copied from memory.
+ADD_INVENTORY_SQL = '''
+    INSERT INTO inventories (shop_name, product, description, quantity, price)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (shop_name, product, description) DO UPDATE SET quantity = quantity + excluded.quantity
+'''
+
+UPDATE_INVENTORY_SQL = '''
+    UPDATE inventories
+    SET quantity = quantity - ?
+    WHERE shop_name = ? AND product = ? AND description = ? AND quantity >= ?
+'''
+
+DELETE_PRODUCT_SQL = '''
+    DELETE FROM inventories
+    WHERE shop_name = ? AND product = ? AND description = ? AND quantity <= 0
+'''
+
+@timed()
+def save_account(username, password, role, shop_name):
+    execute_write(SAVE_ACCOUNT_SQL, (username, password, role, shop_name), "saving account data")
 
+@timed()
 def save_inventory(shop_name, product, description, quantity, price):
-    try:
-        c = conn.cursor()
-        c.execute('''
-            INSERT OR REPLACE INTO inventories (shop_name, product, description, quantity, price)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (shop_name, product, description, quantity, price))
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"An error occurred while saving inventory data: {e}")
+    execute_write(SAVE_INVENTORY_SQL, (shop_name, product, description, quantity, price), "saving inventory data")
 
 
-def add_static_shops():
+def add_static_shops(owns_shop=None):
     static_shops = {
         'Foods': [
-            ('Apple', 'Fresh red apple', 100, 13.50),
-            ('Banana', 'Yellow banana', 150, 14.50),
-            ('Orange', 'Juicy orange', 120, 18.75),
-            ('Bread', 'Whole wheat bread', 80, 105.00),
-            ('Milk', '1L fresh milk', 60, 120.20),
-            ('Eggs', 'Dozen eggs', 90, 120.50),
-            ('Chicken', '1kg chicken breast', 50, 336.00),
-            ('Rice', '1kg white rice', 200, 60.00),
-            ('Carrot', 'Fresh carrots', 100, 36.80),
-            ('Potato', 'Brown potatoes', 120, 45.90)
+            ('Apple', 'Fresh red apple', 100, 1350),
+            ('Banana', 'Yellow banana', 150, 1450),
+            ('Orange', 'Juicy orange', 120, 1875),
+            ('Bread', 'Whole wheat bread', 80, 10500),
+            ('Milk', '1L fresh milk', 60, 12020),
+            ('Eggs', 'Dozen eggs', 90, 12050),
+            ('Chicken', '1kg chicken breast', 50, 33600),
+            ('Rice', '1kg white rice', 200, 6000),
+            ('Carrot', 'Fresh carrots', 100, 3680),
+            ('Potato', 'Brown potatoes', 120, 4590)
         ],
         'Goods': [
-            ('Shampoo', '500ml bottle', 100, 160.50),
-            ('Soap', '100g bar soap', 200, 64.00),
-            ('Toothpaste', '200g tube', 150, 69.50),
-            ('Notebook', '200-page notebook', 80, 47.75),
-            ('Pen', 'Ballpoint pen', 200, 10.50),
-            ('T-shirt', 'Cotton T-shirt', 100, 200.00),
-            ('Detergent', '1kg detergent powder', 90, 215.00),
-            ('Coffee', '200g instant coffee', 60, 70.00),
-            ('Tea', '100g black tea', 70, 80.50),
-            ('Sugar', '1kg white sugar', 150, 136.50)
+            ('Shampoo', '500ml bottle', 100, 16050),
+            ('Soap', '100g bar soap', 200, 6400),
+            ('Toothpaste', '200g tube', 150, 6950),
+            ('Notebook', '200-page notebook', 80, 4775),
+            ('Pen', 'Ballpoint pen', 200, 1050),
+            ('T-shirt', 'Cotton T-shirt', 100, 20000),
+            ('Detergent', '1kg detergent powder', 90, 21500),
+            ('Coffee', '200g instant coffee', 60, 7000),
+            ('Tea', '100g black tea', 70, 8050),
+            ('Sugar', '1kg white sugar', 150, 13650)
         ]
     }
 
-    for shop_name, products in static_shops.items():
-        inventories[shop_name] = {}
-        for product, description, quantity, price in products:
-            inventories[shop_name][(product, description)] = {'quantity': quantity, 'price': price}
-            save_inventory(shop_name, product, description, quantity, price)
+    shop_names = [shop_name for shop_name in static_shops if owns_shop is None or owns_shop(shop_name)]
+    for shop_name in shop_names:
+        inventories.register(shop_name)
 
-def update_inventory_in_database(shop_name, product, description, quantity):
-    try:
+    # Seeding runs once per database, restarting must not reset stock that has been sold or reserved.
+    # Databases from before seeds were recorded only get the shops that have never been stocked.
+    with db_lock:
         c = conn.cursor()
-        c.execute('''
-            UPDATE inventories 
-            SET quantity = quantity - ?
-            WHERE shop_name = ? AND product = ? AND description = ?
-        ''', (quantity, shop_name, product, description))
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"An error occurred while updating inventory in the database: {e}")
+        if c.execute('SELECT 1 FROM seeds WHERE name = ?', ('static_shops',)).fetchone():
+            return
+        stocked = {shop_name for shop_name in shop_names
+                   if c.execute('SELECT 1 FROM inventories WHERE shop_name = ? LIMIT 1', (shop_name,)).fetchone()}
+    with UnitOfWork():
+        for shop_name in shop_names:
+            if shop_name in stocked:
+                continue
+            for product, description, quantity, price in static_shops[shop_name]:
+                save_inventory(shop_name, product, description, quantity, price)
+        execute_write('INSERT INTO seeds (name, applied_at) VALUES (?, ?)',
+                      ('static_shops', time.strftime('%Y-%m-%d %H:%M:%S')), "recording seed data")
 
-def delete_product_from_database(shop_name, product, description):  
-    try:
-        c = conn.cursor()
-        c.execute('''
-            DELETE FROM inventories 
-            WHERE shop_name = ? AND product = ? AND description = ?
-        ''', (shop_name, product, description))
-        conn.commit()
-        print(f"Removed {product} ({description}) from {shop_name}'s inventory in the database.\n")
-    except sqlite3.Error as e:
-        print(f"An error occurred while deleting product from database: {e}")
-        
 accounts = {}  
-inventories = {}
+inventories = LazyInventories()
 conn = None
+pool = None
+db_lock = threading.RLock()
+work_state = threading.local()
+accounts_lock = threading.Lock()
+carts = {}
+
+def start(db_path=DB_PATH, owns_shop=None, profile=False):
+    timings = {}
+    for stage, step in (('initialize_database', lambda: initialize_database(db_path)),
+                        ('load_data', load_data),
+                        ('add_static_shops', lambda: add_static_shops(owns_shop))):
+        began = time.perf_counter()
+        step()
+        timings[stage] = time.perf_counter() - began
+    background_flusher.start()
+    if profile:
+        for stage, seconds in timings.items():
+            print(f"{stage:<20} {seconds * 1000:8.1f} ms")
+        print(f"{'startup':<20} {sum(timings.values()) * 1000:8.1f} ms\n")
+    return timings
+
+def check_consistency(shop_names=None):
+    # The table should hold what memory shows plus the stock reserved by pending orders, minus stock not yet flushed.
+    # Orders being dispatched at the moment of the check can show up as transient drift.
+    drift = []
+    for shop_name in shop_names if shop_names is not None else list(inventories.resident):
+        inventory = inventories[shop_name]
+        reserved = {}
+        for order in order_queue.shop_orders(shop_name):
+            product_key = (order['Product'], order['Description'])
+            reserved[product_key] = reserved.get(product_key, 0) + order['Quantity']
+        with inventory_sync.lock, db_lock:
+            rows = {(product, description): (quantity, price)
+                    for product, description, quantity, price in conn.execute(LOAD_SHOP_SQL, (shop_name,))}
+            unsaved = {product_key: inventory_sync.pending(shop_name, product_key) for product_key in inventory}
+            snapshot = {product_key: (details['quantity'], details['price']) for product_key, details in list(inventory.items())}
+        for product_key in snapshot.keys() | rows.keys() | reserved.keys():
+            memory_quantity, memory_price = snapshot.get(product_key, (0, None))
+            expected = memory_quantity + reserved.get(product_key, 0) - unsaved.get(product_key, 0)
+            stored, stored_price = rows.get(product_key, (0, None))
+            if expected != stored or (product_key in snapshot and product_key in rows and memory_price != stored_price):
+                drift.append({'shop': shop_name, 'product': product_key[0], 'description': product_key[1],
+                              'expected': expected, 'stored': stored, 'memory_price': memory_price, 'stored_price': stored_price})
+    return drift
+
+def write_metrics():
+    return export_metrics(gauges={'pool': pool.metrics(), 'stock_locks': stock_locks.metrics()})
+
+def stop():
+    background_flusher.stop()
+    delivery_scheduler.shutdown()
+    inventory_sync.flush()
+    order_journal.flush()
+    write_metrics()
+    pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Carhins Basic Shopping and Inventory Management System.")
+    parser.add_argument('--import-accounts', metavar='FILE', help="create the accounts in a CSV or JSONL file and exit")
+    parser.add_argument('--profile-startup', action='store_true', help="report how long each startup stage takes")
+    parser.add_argument('--profile', metavar='FILE', help="record a cProfile capture of the menu session to FILE")
+    args = parser.parse_args()
 
-initialize_database()
-
-try:
-    load_data()
-    add_static_shops()
-except sqlite3.Error as e:
-    print(f"Error loading data: {e}")
-    exit(1)  
-
-order_system = OrderSystem()
-current_user = None
-
-
-while True:
-    if current_user:            
-        print(f"Logged in as: {current_user}")
-        print("1. Log out")
-        print("2. Switch account")
-        if accounts[current_user]['role'] == 'user':
-            print("3. Display available products")
-            print("4. Check out order")
-            print("5. Deliver order")
-            print("6. Cancel order")
-            print("7. Display orders")
-        elif accounts[current_user]['role'] == 'seller':
-            print("3. Add stock")
-            print("4. Check inventory")
-        print("0. Exit")
-    else:
-        print("--Welcome to Carhins Basic Shopping and Inventory Management System--")
-        print("1. Sign up")
-        print("2. Log in")
-        print("0. Exit")
+    try:
+        start(profile=args.profile_startup)
+    except sqlite3.Error as e:
+        print(f"Error loading data: {e}")
+        sys.exit(1)
 
-    choice = input("Choose an option: ")
+    if args.import_accounts:
+        try:
+            import_accounts(args.import_accounts)
+        except OSError as e:
+            print(f"Could not read file: {e}")
+        stop()
+        return
 
-    if choice == '1':
-        if current_user:
-            current_user = log_out()
-        else:
-            sign_up()
-    elif choice == '2':
-        if current_user:
-            current_user = switch_account()
-        else:
-            current_user = log_in()
-    elif choice == '3' and current_user:
-        if accounts[current_user]['role'] == 'user':
-            display_available_products()
-        elif accounts[current_user]['role'] == 'seller':
-            add_stock(current_user)
-    elif choice == '4' and current_user:
-        if accounts[current_user]['role'] == 'user':
-            order_system.check_out_order(current_user)
-        elif accounts[current_user]['role'] == 'seller':
-            check_inventory(current_user)
-    elif choice == '5' and current_user and accounts[current_user]['role'] == 'user':
-        order_system.deliver_order(current_user)
-    elif choice == '6' and current_user and accounts[current_user]['role'] == 'user':
-        order_system.cancel_order(current_user)
-    elif choice == '7' and current_user and accounts[current_user]['role'] == 'user':
-        order_system.display_orders(current_user)
-    elif choice == '0':
-        break
-    else:
-        print("Invalid option. Please try again.\n")
-conn.close()
+    order_system = OrderSystem()
+    current_user = None
+
+    with profile_session(args.profile):
+        while True:
+            if current_user:
+                order_system.settle_deliveries(current_user)
+                print(f"Logged in as: {current_user}")
+                print("1. Log out")
+                print("2. Switch account")
+                if accounts[current_user]['role'] == 'user':
+                    print("3. Display available products")
+                    print("4. Check out order")
+                    print("5. Deliver order")
+                    print("6. Cancel order")
+                    print("7. Display orders")
+                    print("8. Check out cart")
+                    print("9. Deliver all orders")
+                elif accounts[current_user]['role'] == 'seller':
+                    print("3. Add stock")
+                    print("4. Check inventory")
+                    print("5. Import stock from file")
+                    print("6. Sales report")
+                print("0. Exit")
+            else:
+                print("--Welcome to Carhins Basic Shopping and Inventory Management System--")
+                print("1. Sign up")
+                print("2. Log in")
+                print("0. Exit")
+
+            choice = input("Choose an option: ")
+
+            if choice == '1':
+                if current_user:
+                    current_user = log_out()
+                else:
+                    sign_up()
+            elif choice == '2':
+                if current_user:
+                    current_user = switch_account()
+                else:
+                    current_user = log_in()
+            elif choice == '3' and current_user:
+                if accounts[current_user]['role'] == 'user':
+                    display_available_products(prompt_sort(), pause=prompt_more)
+                elif accounts[current_user]['role'] == 'seller':
+                    add_stock(current_user)
+            elif choice == '4' and current_user:
+                if accounts[current_user]['role'] == 'user':
+                    order_system.check_out_order(current_user)
+                elif accounts[current_user]['role'] == 'seller':
+                    check_inventory(current_user, prompt_sort(), pause=prompt_more)
+            elif choice == '5' and current_user:
+                if accounts[current_user]['role'] == 'user':
+                    order_system.deliver_order(current_user)
+                elif accounts[current_user]['role'] == 'seller':
+                    import_stock_from_file(current_user)
+            elif choice == '6' and current_user:
+                if accounts[current_user]['role'] == 'user':
+                    order_system.cancel_order(current_user)
+                elif accounts[current_user]['role'] == 'seller':
+                    sales_report(current_user)
+            elif choice == '7' and current_user and accounts[current_user]['role'] == 'user':
+                order_system.display_orders(current_user)
+            elif choice == '8' and current_user and accounts[current_user]['role'] == 'user':
+                order_system.check_out_cart(current_user)
+            elif choice == '9' and current_user and accounts[current_user]['role'] == 'user':
+                order_system.deliver_all_orders(current_user)
+            elif choice == '0':
+                break
+            else:
+                print("Invalid option. Please try again.\n")
+    stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import sqlite3
+
+from money import format_cents
+
+# Reports read the daily_sales and product_sales rollups, which are kept up to date as sales are written,
+# so they stay cheap no matter how many rows the sales table has. Revenue is in centavos.
+
+def revenue_per_shop(conn, shop_name=None, since=None, until=None):
+    query = 'SELECT shop_name, SUM(orders), SUM(quantity), SUM(revenue) FROM daily_sales WHERE 1 = 1'
+    params = []
+    if shop_name is not None:
+        query += ' AND shop_name = ?'
+        params.append(shop_name)
+    if since is not None:
+        query += ' AND day >= ?'
+        params.append(since)
+    if until is not None:
+        query += ' AND day <= ?'
+        params.append(until)
+    query += ' GROUP BY shop_name ORDER BY SUM(revenue) DESC'
+    return [{'shop': shop, 'orders': orders, 'quantity': quantity, 'revenue': revenue}
+            for shop, orders, quantity, revenue in conn.execute(query, params)]
+
+def top_products(conn, shop_name=None, limit=10, by='quantity'):
+    if by not in ('quantity', 'revenue', 'orders'):
+        raise ValueError(f"Can't rank products by {by}.")
+    query = 'SELECT shop_name, product, description, orders, quantity, revenue FROM product_sales'
+    params = []
+    if shop_name is not None:
+        query += ' WHERE shop_name = ?'
+        params.append(shop_name)
+    query += f' ORDER BY {by} DESC LIMIT ?'
+    params.append(limit)
+    return [{'shop': shop, 'product': product, 'description': description,
+             'orders': orders, 'quantity': quantity, 'revenue': revenue}
+            for shop, product, description, orders, quantity, revenue in conn.execute(query, params)]
+
+def daily_volume(conn, shop_name=None, days=30):
+    query = 'SELECT day, SUM(orders), SUM(quantity), SUM(revenue) FROM daily_sales'
+    params = []
+    if shop_name is not None:
+        query += ' WHERE shop_name = ?'
+        params.append(shop_name)
+    query += ' GROUP BY day ORDER BY day DESC LIMIT ?'
+    params.append(days)
+    rows = conn.execute(query, params).fetchall()
+    return [{'day': day, 'orders': orders, 'quantity': quantity, 'revenue': revenue}
+            for day, orders, quantity, revenue in reversed(rows)]
+
+def inventory_turnover(conn, shop_name=None):
+    # Units sold against the units still on hand, per shop.
+    query = '''
+        SELECT shop_name, SUM(sold), SUM(stock) FROM (
+            SELECT shop_name, quantity AS sold, 0 AS stock FROM product_sales
+            UNION ALL
+            SELECT shop_name, 0 AS sold, quantity AS stock FROM inventories
+        )
+    '''
+    params = []
+    if shop_name is not None:
+        query += ' WHERE shop_name = ?'
+        params.append(shop_name)
+    query += ' GROUP BY shop_name ORDER BY shop_name'
+    return [{'shop': shop, 'sold': sold, 'stock': stock, 'turnover': round(sold / stock, 2) if stock else None}
+            for shop, sold, stock in conn.execute(query, params)]
+
+def rebuild_rollups(conn):
+    with conn:
+        conn.execute('DELETE FROM daily_sales')
+        conn.execute('DELETE FROM product_sales')
+        conn.execute('''
+            INSERT INTO daily_sales (day, shop_name, orders, quantity, revenue)
+            SELECT day, shop_name, COUNT(*), SUM(quantity), SUM(total) FROM sales GROUP BY day, shop_name
+        ''')
+        conn.execute('''
+            INSERT INTO product_sales (shop_name, product, description, orders, quantity, revenue)
+            SELECT shop_name, product, description, COUNT(*), SUM(quantity), SUM(total)
+            FROM sales GROUP BY shop_name, product, description
+        ''')
+
+def report_lines(conn, shop_name=None, limit=10, days=7):
+    lines = ["Revenue per shop:"]
+    for row in revenue_per_shop(conn, shop_name):
+        lines.append(f"  {row['shop']}: {row['orders']} order(s), {row['quantity']} unit(s), {format_cents(row['revenue'])} revenue")
+    lines.append(f"Top {limit} products:")
+    for row in top_products(conn, shop_name, limit):
+        lines.append(f"  {row['shop']} - {row['product']} ({row['description']}): "
+                     f"{row['quantity']} unit(s), {format_cents(row['revenue'])} revenue")
+    lines.append(f"Last {days} day(s):")
+    for row in daily_volume(conn, shop_name, days):
+        lines.append(f"  {row['day']}: {row['orders']} order(s), {row['quantity']} unit(s), {format_cents(row['revenue'])} revenue")
+    lines.append("Inventory turnover:")
+    for row in inventory_turnover(conn, shop_name):
+        turnover = 'n/a' if row['turnover'] is None else f"{row['turnover']:.2f}"
+        lines.append(f"  {row['shop']}: {row['sold']} sold, {row['stock']} in stock, turnover {turnover}")
+    return lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sales reports for the shopping and inventory system.")
+    parser.add_argument('--db', default='shop_system.db')
+    parser.add_argument('--shop', help="only report on this shop")
+    parser.add_argument('--limit', type=int, default=10, help="number of top products to show")
+    parser.add_argument('--days', type=int, default=7, help="number of days of volume to show")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the rollups from the sales table first")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.rebuild:
+        rebuild_rollups(conn)
+    print("\n".join(report_lines(conn, args.shop, args.limit, args.days)))
+    conn.close()
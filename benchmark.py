@@ -0,0 +1,229 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import Version4 as shop
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def measure(calls, memory=False, setup=None):
+    # Latency and memory come from separate runs of the same workload, so tracemalloc never slows the timed calls.
+    # setup runs before every call and is left out of both.
+    if memory:
+        peak = 0
+        tracemalloc.start()
+        for call in calls:
+            if setup is not None:
+                setup()
+            tracemalloc.reset_peak()
+            call()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        return {'peak_memory_kb': peak / 1024}
+    latencies = []
+    for call in calls:
+        if setup is not None:
+            setup()
+        began = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - began)
+    elapsed = sum(latencies)
+    return {
+        'ops': len(latencies),
+        'seconds': elapsed,
+        'ops_per_sec': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+def report_row(name, result):
+    print("{:<28} {:>8} {:>12.0f} {:>10.3f} {:>10.3f} {:>12.0f}".format(
+        name, result['ops'], result['ops_per_sec'], result['p50_ms'], result['p99_ms'], result['peak_memory_kb']))
+
+def merge_peaks(results, peaks):
+    for name, result in results.items():
+        if 'ops' in result:
+            result['peak_memory_kb'] = peaks[name]['peak_memory_kb']
+        else:
+            merge_peaks(result, peaks[name])
+    return results
+
+def quiet(function, *args):
+    def call():
+        with redirect_stdout(io.StringIO()):
+            return function(*args)
+    return call
+
+def reset_state():
+    shop.delivery_scheduler.shutdown()
+    shop.inventory_sync.flush()
+    shop.order_journal.flush()
+    shop.accounts.clear()
+    shop.inventories = shop.LazyInventories()
+    shop.order_queue = shop.OrderQueue()
+    shop.delivery_scheduler = shop.DeliveryScheduler(delivery_time=0)
+
+def workload(db_path, shops, products, users, orders, repeats, seed, memory=False):
+    rng = random.Random(seed)
+    results = {}
+    shop.delivery_scheduler = shop.DeliveryScheduler(delivery_time=0)
+    shop.start(db_path)
+
+    shop_names = [f'Shop {i}' for i in range(shops)]
+    catalog = [(shop_name, f'Product {j}', f'Description {j}') for shop_name in shop_names for j in range(products)]
+    results['add_stock'] = measure([
+        (lambda item=item: shop.add_product(item[0], item[1], item[2], 1000, rng.randint(100, 100000)))
+        for item in catalog], memory)
+
+    # Account setup is not measured here, login cost has its own benchmark.
+    usernames = [f'user{i}' for i in range(users)]
+    for username in usernames:
+        shop.create_account(username, 'password123', 'user')
+
+    placed = []
+
+    def check_out(username, item):
+        try:
+            placed.append(shop.place_order(username, item[0], item[1], item[2], rng.randint(1, 3), 'Benchmark Street'))
+        except shop.InsufficientStockError:
+            pass
+
+    results['check_out_order'] = measure([
+        (lambda username=rng.choice(usernames), item=rng.choice(catalog): check_out(username, item))
+        for _ in range(orders)], memory)
+
+    results['display_available_products'] = measure(
+        [quiet(shop.display_available_products) for _ in range(repeats)], memory)
+
+    canceled = rng.sample(placed, len(placed) // 4)
+    results['cancel_order'] = measure([
+        (lambda order=order: shop.cancel_order_by_id(order['Name'], order['ID'])) for order in canceled], memory)
+
+    # One call per pending order, so every measured call delivers something.
+    results['deliver_order'] = measure([
+        quiet(shop.dispatch_order, order['Name']) for order in shop.order_queue], memory)
+
+    def load():
+        shop.load_data()
+        for shop_name in shop.inventories:
+            shop.inventories[shop_name]
+
+    results['load_data'] = measure([load for _ in range(repeats)], memory, setup=reset_state)
+    shop.stop()
+    return results
+
+def login_benchmark(work_factors, logins, memory=False):
+    results = {}
+    for iterations in work_factors:
+        stored = [shop.hash_password(f'password{i}', iterations) for i in range(logins)]
+        shop.verification_cache.clear()
+        cold = measure([
+            (lambda i=i: shop.verify_password(stored[i], f'password{i}')) for i in range(logins)], memory)
+        warm = measure([
+            (lambda i=i: shop.verify_password(stored[i], f'password{i}')) for i in range(logins)], memory)
+        results[str(iterations)] = {'cold': cold, 'cached': warm}
+    return results
+
+def memory_layouts(count):
+    def dict_product(i):
+        return {'quantity': i, 'price': 1350}
+
+    def dict_order(i):
+        return {'ID': i, 'Name': 'user', 'Shop': 'Foods', 'Address': 'addr', 'Product': 'Apple',
+                'Description': 'Fresh red apple', 'Quantity': 1, 'Price': 1350, 'Total': 1350}
+
+    def record_product(i):
+        return shop.ProductRecord(i, 1350)
+
+    def record_order(i):
+        return shop.OrderRecord('user', 'Foods', 'addr', 'Apple', 'Fresh red apple', 1, 1350, 1350, i)
+
+    keys = [(f'Product {i}', 'Description') for i in range(count)]
+    results = {}
+    for layout, make_product, make_order in (('dict', dict_product, dict_order),
+                                             ('slots', record_product, record_order)):
+        tracemalloc.start()
+        products = {keys[i]: make_product(i) for i in range(count)}
+        products_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        orders = [make_order(i) for i in range(count)]
+        orders_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[layout] = {'product_bytes': products_size / count, 'order_bytes': orders_size / count}
+        print("{:<28} {:>12.0f} B/product {:>8.0f} B/order".format(
+            f'memory layout: {layout}', results[layout]['product_bytes'], results[layout]['order_bytes']))
+        del products, orders
+    return results
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    print(f"\nChange in ops/sec against {baseline_path}:")
+    for name, result in results.items():
+        previous = baseline.get(name, {}).get('ops_per_sec')
+        if previous:
+            print("{:<28} {:>+9.1f}%".format(name, (result['ops_per_sec'] - previous) / previous * 100))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the shopping and inventory hot paths.")
+    parser.add_argument('--shops', type=int, default=10)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--layout-entries', type=int, default=100000)
+    parser.add_argument('--work-factors', default='10000,100000,300000',
+                        help="comma separated PBKDF2 iteration counts to benchmark logins at")
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    options = (args.shops, args.products, args.users, args.orders, args.repeats, args.seed)
+    work_factors = [int(factor) for factor in args.work_factors.split(',')]
+    passes = []
+    for memory in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            reset_state()
+            passes.append((workload(os.path.join(directory, 'benchmark.db'), *options, memory),
+                           login_benchmark(work_factors, args.logins, memory)))
+    (results, logins), (peaks, login_peaks) = passes
+    merge_peaks(results, peaks)
+    merge_peaks(logins, login_peaks)
+
+    print("{:<28} {:>8} {:>12} {:>10} {:>10} {:>12}".format('Operation', 'Ops', 'Ops/sec', 'p50 ms', 'p99 ms', 'Peak KB'))
+    print("-" * 85)
+    for name, result in results.items():
+        report_row(name, result)
+    for iterations, result in logins.items():
+        report_row(f'login ({iterations} iter, cold)', result['cold'])
+        report_row(f'login ({iterations} iter, cached)', result['cached'])
+    layouts = memory_layouts(args.layout_entries)
+
+    report = {
+        'parameters': vars(args),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': results,
+        'logins': logins,
+        'memory_layouts': layouts
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,126 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Set SHOP_METRICS=1 before starting to collect call counts and latency histograms.
+# With it unset, timed() hands back the undecorated function and timer() a shared no-op context,
+# so the hot paths pay nothing.
+ENABLED = os.environ.get('SHOP_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+METRICS_FILE = os.environ.get('SHOP_METRICS_FILE')
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+class Histogram:
+    __slots__ = ('count', 'total', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.total, 'buckets': dict(zip([*map(str, BUCKETS), '+Inf'], self.buckets))}
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+
+registry = Registry()
+_disabled = nullcontext()
+
+def timed(name=None):
+    def decorate(function):
+        if not ENABLED:
+            return function
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.observe(label, time.perf_counter() - began)
+        return wrapper
+    return decorate
+
+@contextmanager
+def _timer(name):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - began)
+
+def timer(name):
+    return _timer(name) if ENABLED else _disabled
+
+def prometheus_text(snapshot, gauges=None):
+    lines = ['# TYPE shop_call_seconds histogram']
+    for name, histogram in snapshot.items():
+        cumulative = 0
+        for bound, count in histogram['buckets'].items():
+            cumulative += count
+            lines.append(f'shop_call_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'shop_call_seconds_sum{{name="{name}"}} {histogram["sum"]}')
+        lines.append(f'shop_call_seconds_count{{name="{name}"}} {histogram["count"]}')
+    for group, values in (gauges or {}).items():
+        for key, value in values.items():
+            lines.append(f'# TYPE shop_{group}_{key} gauge')
+            lines.append(f'shop_{group}_{key} {value}')
+    return '\n'.join(lines) + '\n'
+
+def export_metrics(path=None, gauges=None):
+    # Files ending in .prom get Prometheus text, anything else JSON. The file is replaced atomically.
+    path = path or METRICS_FILE
+    if not path:
+        return None
+    snapshot = registry.snapshot()
+    if path.endswith('.prom'):
+        data = prometheus_text(snapshot, gauges)
+    else:
+        data = json.dumps({'timestamp': time.time(), 'calls': snapshot, 'gauges': gauges or {}}, indent=2)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(temporary, path)
+    return path
+
+@contextmanager
+def profile_session(path):
+    # Opt-in cProfile capture, the stats file can be read with `python -m pstats FILE`.
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,44 @@
+from array import array
+from decimal import Decimal, InvalidOperation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Money is kept as integer centavos everywhere, pesos only appear when reading input and printing.
+# The batch helpers take parallel sequences of quantities and prices and use NumPy when it is installed.
+
+def to_cents(pesos):
+    try:
+        cents = Decimal(str(pesos).strip()) * 100
+        if not cents.is_finite():
+            raise InvalidOperation
+        if cents != cents.to_integral_value():
+            raise ValueError(f"{pesos} has more than two decimal places.")
+        return int(cents)
+    except (InvalidOperation, OverflowError):
+        raise ValueError(f"{pesos!r} is not an amount of money.")
+
+def parse_cents(value):
+    if isinstance(value, bool):
+        raise ValueError(f"{value!r} is not an amount in centavos.")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    raise ValueError(f"{value!r} is not an amount in centavos.")
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    pesos, centavos = divmod(abs(cents), 100)
+    return f"{sign}{pesos}.{centavos:02d}"
+
+def order_totals(quantities, prices):
+    if numpy is not None:
+        return numpy.asarray(quantities, dtype=numpy.int64) * numpy.asarray(prices, dtype=numpy.int64)
+    return array('q', map(int.__mul__, quantities, prices))
+
+def total(quantities, prices):
+    totals = order_totals(quantities, prices)
+    return int(totals.sum()) if numpy is not None else sum(totals)
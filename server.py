@@ -0,0 +1,219 @@
+import argparse
+import json
+import secrets
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Version4 as shop
+from instrumentation import timer
+from sharding import ShardRouter
+
+ERROR_STATUS = {
+    shop.LoginError: 401,
+    shop.LoginThrottledError: 429,
+    shop.PermissionDeniedError: 403,
+    shop.ProductNotFoundError: 404,
+    shop.OrderNotFoundError: 404,
+    shop.InvalidPasswordError: 400,
+    shop.InvalidShopNameError: 400,
+    shop.InvalidUsernameError: 400,
+    shop.InvalidRoleError: 400,
+    shop.InvalidProductError: 400,
+    shop.InsufficientStockError: 409,
+    shop.InsufficientFundsError: 402,
+}
+
+sessions = {}
+sessions_lock = threading.Lock()
+# Inventory and order calls go to Version4 directly, or to a ShardRouter when running with --shards.
+backend = shop
+
+def create_session(username):
+    token = secrets.token_hex(16)
+    with sessions_lock:
+        sessions[token] = username
+    return token
+
+def order_dicts(orders):
+    return [order.to_dict() for order in orders]
+
+def sign_up(username, body):
+    backend.create_account(body.get('username', ''), body.get('password', ''), body.get('role', ''), body.get('shop_name'))
+    return 201, {'username': body['username']}
+
+def log_in(username, body):
+    username = shop.authenticate(body.get('username', ''), body.get('password', ''))
+    return 201, {'token': create_session(username), 'role': shop.accounts[username]['role']}
+
+def page_options(body):
+    limit = body.get('limit')
+    return {
+        'sort_by': body.get('sort'),
+        'descending': body.get('order') == 'desc',
+        'offset': int(body.get('offset', 0)),
+        'limit': None if limit is None else int(limit)
+    }
+
+def products(username, body):
+    return 200, backend.list_products(shop_name=body.get('shop'), **page_options(body))
+
+def inventory(username, body):
+    return 200, backend.list_inventory(username, **page_options(body))
+
+def add_stock(username, body):
+    details = backend.stock_product(username, body.get('product'), body.get('description'),
+                                 body.get('quantity'), body.get('price'))
+    return 201, {'quantity': details['quantity'], 'price': details['price']}
+
+def orders(username, body):
+    return 200, order_dicts(backend.list_orders(username))
+
+def check_out_order(username, body):
+    shop.require_role(username, 'user')
+    order = backend.place_order(username, body.get('shop_name'), body.get('product'), body.get('description'),
+                             int(body.get('quantity', 0)), body.get('address', ''))
+    return 201, order.to_dict()
+
+def deliver_order(username, body):
+    if body.get('all'):
+        orders = backend.dispatch_orders(username)
+        if not orders:
+            raise shop.OrderNotFoundError("No orders to deliver.")
+        return 202, order_dicts(orders)
+    order = backend.dispatch_order(username)
+    if order is None:
+        raise shop.OrderNotFoundError("No orders to deliver.")
+    return 202, order.to_dict()
+
+def cart(username, body):
+    return 200, shop.get_cart(username).to_list()
+
+def add_to_cart(username, body):
+    shop.require_role(username, 'user')
+    cart = shop.get_cart(username)
+    cart.add(body['shop_name'], body['product'], body['description'], int(body['quantity']))
+    return 201, cart.to_list()
+
+def remove_from_cart(username, body):
+    cart = shop.get_cart(username)
+    if cart.remove(body['shop_name'], body['product'], body['description']) is None:
+        raise shop.ProductNotFoundError("Not in the cart.")
+    return 200, cart.to_list()
+
+def check_out_cart(username, body):
+    shop.require_role(username, 'user')
+    cart = shop.get_cart(username)
+    orders = backend.place_cart(username, cart, body.get('address', ''))
+    cart.clear()
+    return 201, order_dicts(orders)
+
+def cancel_order(username, body):
+    return 200, backend.cancel_order_by_id(username, int(body['order_id'])).to_dict()
+
+def deliveries(username, body):
+    return 200, order_dicts(backend.arrived_orders(username))
+
+def pay(username, body):
+    # Money is in centavos. Without an order_id every arrived order is paid for at once.
+    money = shop.parse_cents(body['money'])
+    if 'order_id' in body:
+        return 200, {'change': backend.pay_delivery(username, int(body['order_id']), money)}
+    return 200, {'change': backend.pay_deliveries(username, money)}
+
+# (method, path) -> (handler, needs a session)
+ROUTES = {
+    ('POST', '/accounts'): (sign_up, False),
+    ('POST', '/sessions'): (log_in, False),
+    ('GET', '/products'): (products, True),
+    ('GET', '/inventory'): (inventory, True),
+    ('POST', '/inventory'): (add_stock, True),
+    ('GET', '/orders'): (orders, True),
+    ('POST', '/orders'): (check_out_order, True),
+    ('POST', '/orders/cancel'): (cancel_order, True),
+    ('GET', '/cart'): (cart, True),
+    ('POST', '/cart'): (add_to_cart, True),
+    ('POST', '/cart/remove'): (remove_from_cart, True),
+    ('POST', '/cart/checkout'): (check_out_cart, True),
+    ('POST', '/deliveries'): (deliver_order, True),
+    ('GET', '/deliveries'): (deliveries, True),
+    ('POST', '/payments'): (pay, True),
+}
+
+class ShopRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        route = ROUTES.get((method, url.path))
+        if route is None:
+            return self.respond(404, {'error': 'Not found.'})
+        handler, needs_session = route
+
+        username = None
+        if needs_session:
+            token = self.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+            with sessions_lock:
+                username = sessions.get(token)
+            if username is None:
+                return self.respond(401, {'error': 'Log in first.'})
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object.")
+            for name, values in parse_qs(url.query).items():
+                body.setdefault(name, values[-1])
+            with timer(f'{method} {url.path}'):
+                status, payload = handler(username, body)
+        except tuple(ERROR_STATUS) as e:
+            return self.respond(ERROR_STATUS[type(e)], {'error': str(e)})
+        except (KeyError, TypeError, ValueError) as e:
+            return self.respond(400, {'error': f"Invalid request: {e}"})
+        self.respond(status, payload)
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host='127.0.0.1', port=8000, db_path=shop.DB_PATH, shards=0, profile=False):
+    global backend
+    if shards:
+        backend = ShardRouter(shards, db_path)
+    else:
+        shop.start(db_path, profile=profile)
+    server = ThreadingHTTPServer((host, port), ShopRequestHandler)
+    print(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if backend is shop:
+            shop.stop()
+        else:
+            backend.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HTTP/JSON server for the shopping and inventory system.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--db', default=shop.DB_PATH)
+    parser.add_argument('--shards', type=int, default=0,
+                        help="split the shops across this many worker processes, each with its own database file")
+    parser.add_argument('--profile-startup', action='store_true', help="report how long each startup stage takes")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.db, args.shards, args.profile_startup)
@@ -0,0 +1,225 @@
+import os
+import threading
+import zlib
+from multiprocessing import get_context
+
+import Version4 as shop
+import instrumentation
+
+# Each shard is a worker process that owns a subset of the shops and its own SQLite file,
+# so writes to one busy shop only serialize the shops that hash to the same shard.
+
+def shard_for(shop_name, shards):
+    return zlib.crc32(shop_name.encode('utf-8')) % shards
+
+def shard_path(db_path, index):
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+def shop_names():
+    return list(shop.inventories)
+
+def inventory_rows(shop_name, sort_by=None, descending=False, offset=0, limit=None):
+    return shop.product_rows(shop.get_shop_inventory(shop_name), sort_by, descending, False, offset, limit)
+
+def place_lines(username, lines, address):
+    cart = shop.Cart()
+    for (shop_name, product, description), quantity in lines:
+        cart.add(shop_name, product, description, quantity)
+    return shop.place_cart(username, cart, address)
+
+OPERATIONS = {
+    'shop_names': shop_names,
+    'register_shop': shop.inventories.register,
+    'add_product': shop.add_product,
+    'inventory_rows': inventory_rows,
+    'list_products': shop.list_products,
+    'place_order': shop.place_order,
+    'dispatch_order': shop.dispatch_order,
+    'place_lines': place_lines,
+    'dispatch_orders': shop.dispatch_orders,
+    'cancel_order_by_id': shop.cancel_order_by_id,
+    'list_orders': shop.list_orders,
+    'arrived_orders': shop.arrived_orders,
+    'pay_delivery': shop.pay_delivery,
+}
+
+def run_shard(index, shards, db_path, connection):
+    if instrumentation.METRICS_FILE:
+        instrumentation.METRICS_FILE = shard_path(instrumentation.METRICS_FILE, index)
+    shop.start(db_path, owns_shop=lambda shop_name: shard_for(shop_name, shards) == index)
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            name, args, kwargs = request
+            try:
+                connection.send((True, OPERATIONS[name](*args, **kwargs)))
+            except Exception as e:
+                connection.send((False, e))
+    finally:
+        shop.stop()
+        connection.close()
+
+class Shard:
+    def __init__(self, context, index, shards, db_path):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=run_shard, args=(index, shards, db_path, child), daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+
+    def call(self, name, *args, **kwargs):
+        # One request at a time per shard, calls to different shards run in parallel.
+        with self.lock:
+            self.connection.send((name, args, kwargs))
+            ok, result = self.connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        with self.lock:
+            self.connection.send(None)
+        self.process.join()
+
+class ShardRouter:
+    # Offers the same calls as Version4 for the API layer. Accounts stay in this process,
+    # shops and their orders live in the shard that owns them.
+
+    def __init__(self, shards, db_path=shop.DB_PATH):
+        context = get_context('spawn')
+        self.shards = [Shard(context, index, shards, shard_path(db_path, index)) for index in range(shards)]
+        shop.start(db_path, owns_shop=lambda shop_name: False)
+        stocked = set()
+        for shard in self.shards:
+            for shop_name in shard.call('shop_names'):
+                shop.inventories.register(shop_name)
+                stocked.add(shop_name)
+        # A seller's shop with nothing stocked yet is only known from its account in this process.
+        for shop_name in shop.inventories:
+            if shop_name not in stocked:
+                self.owner(shop_name).call('register_shop', shop_name)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        shop.stop()
+
+    def owner(self, shop_name):
+        return self.shards[shard_for(shop_name, len(self.shards))]
+
+    # Order IDs are only unique within a shard, so the shard index is folded into the ID the caller sees.
+    def global_order(self, index, order):
+        if order is not None:
+            order['ID'] = order['ID'] * len(self.shards) + index
+        return order
+
+    def route_order(self, order_id):
+        return divmod(order_id, len(self.shards))
+
+    def create_account(self, username, password, role, shop_name=None):
+        account = shop.create_account(username, password, role, shop_name)
+        if account['shop'] is not None:
+            self.owner(account['shop']).call('register_shop', account['shop'])
+        return account
+
+    def add_product(self, shop_name, product, description, quantity, price):
+        shop.inventories.register(shop_name)
+        return self.owner(shop_name).call('add_product', shop_name, product, description, quantity, price)
+
+    def stock_product(self, username, product, description, quantity, price):
+        shop.require_role(username, 'seller')
+        return self.add_product(shop.accounts[username]['shop'], product, description, quantity, price)
+
+    def list_inventory(self, username, sort_by=None, descending=False, offset=0, limit=None):
+        shop.require_role(username, 'seller')
+        shop_name = shop.accounts[username]['shop']
+        if shop_name not in shop.inventories:
+            raise shop.InvalidShopNameError("Shop not found.")
+        return self.owner(shop_name).call('inventory_rows', shop_name, sort_by, descending, offset, limit)
+
+    def list_products(self, sort_by=None, descending=False, offset=0, limit=None, shop_name=None):
+        options = {'sort_by': sort_by, 'descending': descending, 'offset': offset, 'limit': limit}
+        if shop_name is not None:
+            if shop_name not in shop.inventories:
+                raise shop.InvalidShopNameError("Shop not found.")
+            return self.owner(shop_name).call('list_products', shop_name=shop_name, **options)
+        listings = {}
+        for shard in self.shards:
+            listings.update(shard.call('list_products', **options))
+        # Shops keep the order this process registered them in, whichever shard answered first.
+        return {name: listings[name] for name in shop.inventories if name in listings}
+
+    def place_order(self, username, shop_name, product, description, quantity, address):
+        if shop_name not in shop.inventories:
+            raise shop.InvalidShopNameError("Shop not found.")
+        index = shard_for(shop_name, len(self.shards))
+        order = self.shards[index].call('place_order', username, shop_name, product, description, quantity, address)
+        return self.global_order(index, order)
+
+    def dispatch_order(self, username):
+        for index, shard in enumerate(self.shards):
+            order = shard.call('dispatch_order', username)
+            if order is not None:
+                return self.global_order(index, order)
+        return None
+
+    def place_cart(self, username, cart, address):
+        lines = cart.items()
+        if not lines:
+            raise shop.OrderNotFoundError("The cart is empty.")
+        by_shard = {}
+        for line, quantity in lines:
+            if line[0] not in shop.inventories:
+                raise shop.InvalidShopNameError("Shop not found.")
+            by_shard.setdefault(shard_for(line[0], len(self.shards)), []).append((line, quantity))
+        # Each shard reserves its lines atomically, a failure cancels what earlier shards reserved.
+        placed = []
+        try:
+            for index, shard_lines in sorted(by_shard.items()):
+                placed.extend(self.global_order(index, order)
+                              for order in self.shards[index].call('place_lines', username, shard_lines, address))
+        except Exception:
+            for order in placed:
+                self.cancel_order_by_id(username, order['ID'])
+            raise
+        return placed
+
+    def dispatch_orders(self, username):
+        return [self.global_order(index, order)
+                for index, shard in enumerate(self.shards) for order in shard.call('dispatch_orders', username)]
+
+    def cancel_order_by_id(self, username, order_id):
+        local_id, index = self.route_order(order_id)
+        return self.global_order(index, self.shards[index].call('cancel_order_by_id', username, local_id))
+
+    def list_orders(self, username):
+        return [self.global_order(index, order)
+                for index, shard in enumerate(self.shards) for order in shard.call('list_orders', username)]
+
+    def arrived_orders(self, username):
+        return [self.global_order(index, order)
+                for index, shard in enumerate(self.shards) for order in shard.call('arrived_orders', username)]
+
+    def pay_delivery(self, username, order_id, money):
+        local_id, index = self.route_order(order_id)
+        return self.shards[index].call('pay_delivery', username, local_id, money)
+
+    def pay_deliveries(self, username, money):
+        # The payment is checked against the total over every shard, each order is then settled exactly.
+        orders = self.arrived_orders(username)
+        if not orders:
+            raise shop.OrderNotFoundError("No deliveries to pay for.")
+        due = shop.total([order['Quantity'] for order in orders], [order['Price'] for order in orders])
+        if money < due:
+            raise shop.InsufficientFundsError("Insufficient funds. Please provide enough money.")
+        paid = 0
+        for order in orders:
+            try:
+                self.pay_delivery(username, order['ID'], order['Total'])
+                paid += order['Total']
+            except shop.OrderNotFoundError:
+                pass
+        return money - paid
@@ -0,0 +1,96 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+
+import Version4 as shop
+
+SHOP = 'Stress'
+PRODUCT = ('Widget', 'Stress test widget')
+
+def buy(username, quantity):
+    try:
+        shop.place_order(username, SHOP, PRODUCT[0], PRODUCT[1], quantity, 'Somewhere')
+        return quantity
+    except shop.InsufficientStockError:
+        return 0
+
+def database_quantity(db_path):
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute('SELECT quantity FROM inventories WHERE shop_name = ? AND product = ? AND description = ?',
+                           (SHOP, PRODUCT[0], PRODUCT[1])).fetchone()
+    return row[0] if row else 0
+
+def thread_stress(db_path, stock, threads, attempts):
+    shop.delivery_scheduler.delivery_time = 0
+    shop.start(db_path)
+    shop.add_product(SHOP, PRODUCT[0], PRODUCT[1], stock, 100)
+
+    with ThreadPoolExecutor(threads) as executor:
+        reserved = sum(executor.map(lambda i: buy(f'buyer{i % threads}', 1 + i % 3), range(attempts)))
+    remaining = shop.inventories[SHOP][PRODUCT]['quantity']
+    print(f"Threads: reserved {reserved} of {stock}, {remaining} left in memory")
+    assert reserved <= stock and reserved + remaining == stock, "oversold in memory"
+    assert not shop.check_consistency([SHOP]), "memory drifted from the database"
+
+    with ThreadPoolExecutor(threads) as executor:
+        delivered = sum(executor.map(lambda i: len([order for order in iter(lambda: shop.dispatch_order(f'buyer{i}'), None)]),
+                                     range(threads)))
+    assert not shop.check_consistency([SHOP]), "memory drifted from the database"
+    shop.stop()
+    quantity = database_quantity(db_path)
+    print(f"Threads: dispatched {delivered} order(s), {quantity} left in the database")
+    assert quantity == stock - reserved, "database stock does not match reservations"
+    print(f"Lock metrics: {shop.stock_locks.metrics()}")
+    print(f"Pool metrics: {shop.pool.metrics()}")
+
+def deliver_units(args):
+    # Every process loads the full stock into its own memory, so only the conditional UPDATE
+    # in the delivery transaction stands between them and overselling the shared table.
+    db_path, attempts = args
+    shop.delivery_scheduler.delivery_time = 0
+    shop.start(db_path)
+    username = f'buyer{os.getpid()}'
+    delivered = 0
+    for i in range(attempts):
+        if not buy(username, 1 + i % 3):
+            continue
+        try:
+            order = shop.dispatch_order(username)
+        except shop.InsufficientStockError:
+            for order in shop.list_orders(username):
+                shop.cancel_order_by_id(username, order['ID'])
+            continue
+        if order is not None:
+            delivered += order['Quantity']
+    shop.stop()
+    return delivered
+
+def process_stress(db_path, stock, processes, attempts):
+    shop.start(db_path)
+    shop.add_product(SHOP, PRODUCT[0], PRODUCT[1], stock, 100)
+    shop.stop()
+
+    with get_context('spawn').Pool(processes) as pool:
+        delivered = sum(pool.map(deliver_units, [(db_path, attempts // processes)] * processes))
+    quantity = database_quantity(db_path)
+    with sqlite3.connect(db_path) as conn:
+        sold = conn.execute('SELECT COALESCE(SUM(quantity), 0) FROM sales WHERE shop_name = ?', (SHOP,)).fetchone()[0]
+    print(f"Processes: delivered {delivered} of {stock}, {quantity} left in the database")
+    assert delivered <= stock and quantity == stock - delivered, "oversold in the database"
+    assert sold == delivered, "sales do not match deliveries"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that concurrent buyers cannot oversell stock.")
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--attempts', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        thread_stress(os.path.join(directory, 'threads.db'), args.stock, args.threads, args.attempts)
+        process_stress(os.path.join(directory, 'processes.db'), args.stock, args.processes, args.attempts)
+    print("No oversell.")